@@ -0,0 +1,147 @@
+import pandas as pd
+
+import os
+import uuid
+from datetime import datetime as dt
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from constants import DATE_FORMAT
+
+
+# Date format of the flight and hotel scrapers
+SCRAPER_DATE_FORMAT = "%d/%m/%Y"
+
+CITY = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMAS = {'flight': pa.schema([('city_from', CITY),
+                                ('city_to', CITY),
+                                ('date', pa.date32()),
+                                ('flight', pa.string()),
+                                ('departure', pa.string()),
+                                ('arrival', pa.string()),
+                                ('price', pa.int32()),
+                                ('rank', pa.int8()),
+                                ('month', pa.string())]),
+
+           'hotel': pa.schema([('city', CITY),
+                               ('check_in', pa.date32()),
+                               ('check_out', pa.date32()),
+                               ('hotel', pa.string()),
+                               ('stars', pa.int8()),
+                               ('offered_by', pa.string()),
+                               ('price', pa.int32()),
+                               ('rank', pa.int8()),
+                               ('month', pa.string())])}
+
+# City and date columns of each scrape type (used for the predicate pushdown)
+CITY_COLUMNS = {'flight': ['city_from', 'city_to'], 'hotel': ['city']}
+DATE_COLUMNS = {'flight': ['date'], 'hotel': ['check_in', 'check_out']}
+
+# Columns identifying a query (a query may be stored twice if a run crashed before recording it as completed)
+KEY_COLUMNS = {'flight': ['city_from', 'city_to', 'date'], 'hotel': ['city', 'check_in', 'check_out']}
+
+
+class Columnar_Store(object):
+
+    # Parquet dataset at <root>/<scrape_type>, partitioned by the month of the flight / check-in date
+    def __init__(self, root, scrape_type, date_format = SCRAPER_DATE_FORMAT):
+
+        if scrape_type not in SCHEMAS:
+            raise ValueError('Invalid scraper type')
+
+        self.path = os.path.join(root, scrape_type)
+        self.scrape_type = scrape_type
+        self.schema = SCHEMAS[scrape_type]
+        self.date_format = date_format
+
+
+    # Append a batch of scraped results (as returned by the scrapers)
+    def append(self, df):
+
+        df = df.copy()
+
+        # Results of older versions of the scrapers hold the best offer only
+        if 'rank' not in df:
+            df['rank'] = 1
+
+        for column in DATE_COLUMNS[self.scrape_type]:
+            df[column] = pd.to_datetime(df[column], format = self.date_format).dt.date
+
+        df['month'] = pd.to_datetime(df[DATE_COLUMNS[self.scrape_type][0]]).dt.strftime('%Y-%m')
+
+        table = pa.Table.from_pandas(df[self.schema.names], schema = self.schema, preserve_index = False)
+
+        # A new file per batch and partition, so that appending never rewrites existing data
+        pq.write_to_dataset(table, self.path,
+                            partition_cols = ['month'],
+                            basename_template = 'part-' + uuid.uuid4().hex + '-{i}.parquet')
+
+        return
+
+
+    # Read the data of the given cities / dates only (dates in date_format), filters are pushed down to the files
+    # All the offers of each query are kept if best_only is False (a long-format table, one row per offer)
+    def read(self, cities = None, dates = None, date_format = DATE_FORMAT, best_only = True):
+
+        schema = pa.schema([field for field in self.schema if field.name != 'month'])
+        dataset = ds.dataset(self.path, format = 'parquet', schema = schema, partitioning = None,
+                             exclude_invalid_files = True)
+
+        condition = None
+
+        if cities is not None:
+            for column in CITY_COLUMNS[self.scrape_type]:
+                expr = ds.field(column).isin(list(cities))
+                condition = expr if condition is None else condition & expr
+
+        if dates is not None:
+            dates = pa.array([dt.strptime(date, date_format).date() for date in dates], type = pa.date32())
+
+            for column in DATE_COLUMNS[self.scrape_type]:
+                expr = ds.field(column).isin(dates)
+                condition = expr if condition is None else condition & expr
+
+        df = dataset.to_table(filter = condition).to_pandas()
+
+        # Rows stored before the offers were ranked are best offers
+        df['rank'] = df['rank'].fillna(1).astype('int8')
+
+        if best_only:
+            # Keep the cheapest offer per query
+            df = df.sort_values('price', kind = 'stable').drop_duplicates(KEY_COLUMNS[self.scrape_type])
+        else:
+            # Keep each offer once
+            df = df.drop_duplicates(KEY_COLUMNS[self.scrape_type] + ['rank'])
+
+        df = df.sort_values(KEY_COLUMNS[self.scrape_type] + ['rank']).reset_index(drop = True)
+
+        # Dates in the format the optimizer works with
+        for column in DATE_COLUMNS[self.scrape_type]:
+            df[column] = pd.to_datetime(df[column]).dt.strftime(date_format)
+
+        return df
+
+
+# Read the flights and hotels of the given cities / dates from the store, in the optimizer's format
+def read_scraped(root, cities = None, dates = None, date_format = DATE_FORMAT):
+
+    flights = Columnar_Store(root, 'flight').read(cities, dates, date_format)
+    hotels = Columnar_Store(root, 'hotel').read(cities, dates, date_format)
+
+    return flights, hotels
+
+
+if __name__ == "__main__":
+
+    # Convert the scraped csv files (written by older versions of the scraper) to the columnar store
+    for scrape_type, filename in [('hotel', 'hotels.csv'), ('flight', 'flights.csv')]:
+
+        names = [name for name in SCHEMAS[scrape_type].names if name not in ('rank', 'month')]
+        df = pd.read_csv(filename, header = None, names = names)
+
+        Columnar_Store('scraped.parquet', scrape_type).append(df)
+
+        print(filename, '->', len(df), 'rows')
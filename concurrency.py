@@ -0,0 +1,120 @@
+import pandas as pd
+
+import os
+from time import time
+
+
+# Available memory in MB (MemAvailable on linux, free physical memory otherwise)
+def available_memory():
+
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+class Concurrency_Controller(object):
+
+    # Limit on the no. of jobs running at once (i.e. of active browsers), between min_workers and max_workers
+    # The limit is revised every time window jobs (the current limit, if None) have reported back since the last decision:
+    # - halved if the share of failed jobs exceeds max_error_rate, or the no. of captchas / js alerts per query (recoveries,
+    #   see Wait_Strategy) exceeds max_captcha_rate, as the site is starting to block us
+    # - decreased by one if less than min_free_mb of memory is available, or if the mean time per query has grown by more
+    #   than latency_tolerance over the best one observed, as the machine (or the site) is saturated
+    # - increased by one otherwise, if there's memory for another browser (browser_mb)
+    def __init__(self, min_workers = 1, max_workers = 4, start_workers = None, window = None, max_error_rate = 0.2,
+                 max_captcha_rate = 0.05, latency_tolerance = 0.25, min_free_mb = 1024, browser_mb = 500,
+                 memory = available_memory):
+
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.limit = min_workers if start_workers is None else start_workers
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.max_captcha_rate = max_captcha_rate
+        self.latency_tolerance = latency_tolerance
+        self.min_free_mb = min_free_mb
+        self.browser_mb = browser_mb
+        self.memory = memory # Returns the available memory in MB
+
+        self.best_latency = None # Lowest mean time per query of a window
+        self.observed = []       # Jobs reported back since the last decision
+        self.decisions = []      # One dict per decision
+        self.t_start = time()
+
+
+    # Record a job that reported back (duration in seconds, no. of queries and of recoveries, failed or not)
+    def observe(self, duration, no_queries, recoveries = 0, failed = False):
+
+        self.observed.append((duration, no_queries, recoveries, failed))
+
+        if len(self.observed) >= (self.window or self.limit):
+            self.decide()
+
+        return
+
+
+    # Revise the limit according to the jobs of the last window
+    def decide(self):
+
+        no_jobs = len(self.observed)
+        no_queries = sum(queries for _, queries, _, _ in self.observed)
+        error_rate = sum(failed for _, _, _, failed in self.observed) / no_jobs
+        captcha_rate = sum(recoveries for _, _, recoveries, _ in self.observed) / max(no_queries, 1)
+        free_mb = self.memory()
+
+        # Mean time per query of the jobs that succeeded
+        done = [(duration, queries) for duration, queries, _, failed in self.observed if not failed]
+        latency = sum(duration for duration, _ in done) / max(sum(queries for _, queries in done), 1) if done else None
+
+        if error_rate > self.max_error_rate:
+            limit, action, reason = self.limit // 2, 'back_off', 'error rate'
+        elif captcha_rate > self.max_captcha_rate:
+            limit, action, reason = self.limit // 2, 'back_off', 'captcha rate'
+        elif free_mb < self.min_free_mb:
+            limit, action, reason = self.limit - 1, 'shrink', 'memory'
+        elif latency is not None and self.best_latency is not None and latency > self.best_latency * (1 + self.latency_tolerance):
+            limit, action, reason = self.limit - 1, 'shrink', 'latency'
+        elif free_mb >= self.min_free_mb + self.browser_mb:
+            limit, action, reason = self.limit + 1, 'grow', ''
+        else:
+            limit, action, reason = self.limit, 'hold', 'memory'
+
+        limit = min(max(limit, self.min_workers), self.max_workers)
+
+        if limit == self.limit and action != 'hold':
+            action = 'hold'
+            reason = 'bounds' if not reason else reason
+
+        if latency is not None and (self.best_latency is None or latency < self.best_latency):
+            self.best_latency = latency
+
+        self.decisions.append({'time [s]': time() - self.t_start,
+                               'jobs': no_jobs,
+                               'workers': self.limit,
+                               'action': action,
+                               'reason': reason,
+                               'new workers': limit,
+                               'error rate': error_rate,
+                               'captcha rate': captcha_rate,
+                               'latency [s/query]': latency,
+                               'free memory [MB]': free_mb})
+
+        self.limit = limit
+        self.observed = []
+
+        return
+
+
+    # Decisions taken so far
+    def report(self):
+
+        columns = ['time [s]', 'jobs', 'workers', 'action', 'reason', 'new workers', 'error rate', 'captcha rate',
+                   'latency [s/query]', 'free memory [MB]']
+
+        return pd.DataFrame(self.decisions, columns = columns).round(3)
@@ -0,0 +1,7 @@
+# Constants shared by the scrapers' storage and the optimizer (no dependencies, so that either can import them)
+
+# Date format of the flight and hotel data fed to the optimizer
+DATE_FORMAT = "%m/%d/%Y"
+
+# Price the flight scraper reports when no flight was found on a date
+NO_FLIGHT_PRICE = 99999
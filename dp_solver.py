@@ -0,0 +1,209 @@
+import numpy as np
+
+from time import time
+
+from price_tensors import Price_Tensors
+
+
+# Maximum number of destinations (apart from home) the visited-city bitmask can handle in reasonable time / memory
+MAX_DP_CITIES = 15
+
+
+# Shortest path over (visited-city bitmask, current city, date) states
+# Returns the itinerary as a list of flight keys and a list of hotel keys (integer codes), or None if infeasible
+def solve_dp_arrays(flight_prices, hotel_prices, home_idx, start_idx, end_idx, min_stay, min_cities):
+
+    no_cities, _, no_dates = flight_prices.shape
+
+    # Destinations (bit i of the mask <-> city away[i])
+    away = np.array([idx for idx in range(no_cities) if idx != home_idx])
+    no_away = len(away)
+
+    if no_away > MAX_DP_CITIES:
+        raise ValueError('Too many destinations for the DP engine: {} > {}'.format(no_away, MAX_DP_CITIES))
+
+    # Each visit takes at least min_stay nights between the start and end date
+    max_cities = min(no_away, (end_idx - start_idx) // min_stay)
+
+    if min_cities > max_cities:
+        return None
+
+    # Hotel stays at the destinations, with the stays shorter than min_stay removed
+    days = np.arange(no_dates)
+    too_short = (days[None, :] - days[:, None]) < min_stay
+    stays = np.where(too_short[None, :, :], np.inf, np.asarray(hotel_prices[away], dtype = float))
+
+    # Flights between destinations can only be taken strictly between the start and end dates
+    legs = np.array(flight_prices[np.ix_(away, away)], dtype = float)
+    legs[:, :, :start_idx + 1] = np.inf
+    legs[:, :, end_idx:] = np.inf
+
+    flights_home = np.asarray(flight_prices[away, home_idx, end_idx], dtype = float)
+
+    # Arrival state tables of the first layer: flown from home on the start date
+    arrivals = {}
+    for city in range(no_away):
+        cost = np.full((no_away, no_dates), np.inf)
+        cost[city, start_idx] = flight_prices[home_idx, away[city], start_idx]
+
+        if np.isfinite(cost[city, start_idx]):
+            arrivals[1 << city] = (cost, np.full((no_away, no_dates), -1, dtype = np.int8))
+
+    # Back-pointers: previous city per arrival state and check-in date per departure state
+    prev_city, check_in_date = {}, {}
+
+    best_cost, best_state = np.inf, None
+
+    for no_visited in range(1, max_cities + 1):
+
+        next_arrivals = {}
+
+        for mask, (arrival_cost, arrival_prev) in arrivals.items():
+
+            visited = np.array([city for city in range(no_away) if mask >> city & 1])
+
+            # Departure state tables: check in at date i, check out at date j
+            total = arrival_cost[visited][:, :, None] + stays[visited]
+            departure_cost = np.full((no_away, no_dates), np.inf)
+            departure_cost[visited] = total.min(axis = 1)
+
+            departure_in = np.zeros((no_away, no_dates), dtype = np.int16)
+            departure_in[visited] = total.argmin(axis = 1)
+
+            prev_city[mask] = arrival_prev
+            check_in_date[mask] = departure_in
+
+            # Fly home on the end date
+            if no_visited >= min_cities:
+                cost = departure_cost[visited, end_idx] + flights_home[visited]
+                idx = cost.argmin()
+
+                if cost[idx] < best_cost:
+                    best_cost, best_state = cost[idx], (mask, visited[idx])
+
+            if no_visited == max_cities:
+                continue
+
+            # Fly to the next destination
+            for city in range(no_away):
+                if mask >> city & 1:
+                    continue
+
+                total = departure_cost[visited] + legs[visited, city]
+                cost = total.min(axis = 0)
+                prev = visited[total.argmin(axis = 0)]
+
+                reachable = np.isfinite(cost)
+                if not reachable.any():
+                    continue
+
+                new_mask = mask | 1 << city
+                if new_mask not in next_arrivals:
+                    next_arrivals[new_mask] = (np.full((no_away, no_dates), np.inf),
+                                               np.full((no_away, no_dates), -1, dtype = np.int8))
+
+                new_cost, new_prev = next_arrivals[new_mask]
+                improved = cost < new_cost[city]
+                new_cost[city, improved] = cost[improved]
+                new_prev[city, improved] = prev[improved]
+
+        arrivals = next_arrivals
+
+    if best_state is None:
+        return None
+
+    # Walk the back-pointers from the flight home
+    mask, city = best_state[0], int(best_state[1])
+    check_out = end_idx
+    flight_keys = [(int(away[city]), home_idx, end_idx)]
+    hotel_keys = []
+
+    while True:
+        check_in = int(check_in_date[mask][city, check_out])
+        hotel_keys.append((int(away[city]), check_in, check_out))
+
+        prev = int(prev_city[mask][city, check_in])
+        if prev < 0:
+            flight_keys.append((home_idx, int(away[city]), check_in))
+            break
+
+        flight_keys.append((int(away[prev]), int(away[city]), check_in))
+        mask ^= 1 << city
+        city, check_out = prev, check_in
+
+    return flight_keys[::-1], hotel_keys[::-1]
+
+
+# Exact DP engine on (possibly memory-mapped) price tensors
+# Returns the flight (city_from, city_to, date) and hotel (city, check_in, check_out) keys of the itinerary, or None
+def solve_dp_tensors(tensors, home, start_date, end_date, min_stay, min_cities):
+
+    itinerary = solve_dp_arrays(tensors.flights, tensors.hotels,
+                                home_idx = tensors.city_codes[home],
+                                start_idx = tensors.date_codes[start_date],
+                                end_idx = tensors.date_codes[end_date],
+                                min_stay = min_stay,
+                                min_cities = min_cities)
+
+    if itinerary is None:
+        return None
+
+    flight_keys, hotel_keys = itinerary
+
+    cities, dates = tensors.cities, tensors.dates
+
+    flight_keys = [(cities[a], cities[b], dates[d]) for a, b, d in flight_keys]
+    hotel_keys = [(cities[c], dates[i], dates[j]) for c, i, j in hotel_keys]
+
+    return flight_keys, hotel_keys
+
+
+# Flight and hotel schedules of an itinerary (None if infeasible): the (cheapest) rows of the input data for its keys
+def schedules(flights, hotels, itinerary):
+
+    if itinerary is None:
+        return flights.iloc[0:0].reset_index(drop = True), hotels.iloc[0:0].reset_index(drop = True)
+
+    flight_keys, hotel_keys = itinerary
+
+    cheapest_flights = flights.sort_values('price').drop_duplicates(['city_from', 'city_to', 'date'])
+    cheapest_flights = cheapest_flights.set_index(['city_from', 'city_to', 'date'])
+
+    cheapest_hotels = hotels.sort_values('price').drop_duplicates(['city', 'check_in', 'check_out'])
+    cheapest_hotels = cheapest_hotels.set_index(['city', 'check_in', 'check_out'])
+
+    sol_flights = cheapest_flights.loc[flight_keys]
+    sol_hotels = cheapest_hotels.loc[hotel_keys]
+
+    return sol_flights.reset_index(), sol_hotels.reset_index()
+
+
+# Exact DP engine, returns the same flight / hotel schedules as Model_Builder.solution()
+def solve_dp(flights, hotels, home, start_date, end_date, min_stay, min_cities):
+
+    tensors = Price_Tensors.from_frames(flights, hotels)
+
+    itinerary = solve_dp_tensors(tensors, home, start_date, end_date, min_stay, min_cities)
+
+    return schedules(flights, hotels, itinerary)
+
+
+if __name__ == "__main__":
+
+    from model_builder import synthetic_data
+
+    flights, hotels, home, start_date, end_date = synthetic_data(no_cities = 11, no_days = 32)
+
+    t = time()
+    sol_flights, sol_hotels = solve_dp(flights, hotels, home, start_date, end_date, min_stay = 4, min_cities = 7)
+    elapsed = time() - t
+
+    print("-------------------------")
+    print("Elasped time [s] =", round(elapsed, 3))
+    print("-------------------------")
+    print("Total cost =", sol_flights['price'].sum() + sol_hotels['price'].sum())
+    print("-------------------------")
+    print("Flight Schedule")
+    print(sol_flights, '\n\n')
+    print("Hotel Schedule")
+    print(sol_hotels)
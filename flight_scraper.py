@@ -8,18 +8,39 @@ from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import TimeoutException, WebDriverException
+from waits import Wait_Strategy
+from records import Flight_Record, to_frame
+from constants import NO_FLIGHT_PRICE
+import page_parser
 import re
-import pandas as pd
-from time import sleep
+from time import time
+
+
+# Fire up a new Tor browser
+def tor_browser():
+    return TorBrowserDriver(DRIVER_PATH)
+
+
+# Date segment of a results url, e.g. https://www.skyscanner.com/transport/flights/wroc/mila/190702/?adults=2
+RESULTS_DATE = re.compile(r'/(\d{6})/')
 
 
 class Flight_Scraper(object):
     
-    def __init__(self):
+    def __init__(self, implicit_wait = 10, wait_for_elem = 20, probe_timeout = 1, fast_path = True, parse_pages = False,
+                 save_pages = None, top_n = 1, url = "https://www.skyscanner.com", new_browser = tor_browser):
         # Initialize
-        self.url = "https://www.skyscanner.com"
-        self.implicit_wait = 10 # Wait in between actions
-        self.wait_for_elem = 20 # Wait up to 20 seconds for an element to appear, be clickable, etc.
+        self.url = url
+        self.new_browser = new_browser # Returns a new browser (a Tor browser by default, a headless one for the stand-in site)
+        self.implicit_wait = implicit_wait # Wait in between actions
+        self.wait_for_elem = wait_for_elem # Wait up to 20 seconds for an element to appear, be clickable, etc.
+        self.fast_path = fast_path # Search the next date of a route from the results url instead of the homepage form
+        self.parse_pages = parse_pages # Parse the page source in-process instead of reading each element from the browser
+        self.save_pages = save_pages # Directory to save the parsed page sources to (fixtures of the parsers), if any
+        self.top_n = top_n # No. of offers to keep per query (read from the results list if more than one)
+        
+        # Explicit waits, short probes for elements that may not exist, and per-step timings
+        self.waits = Wait_Strategy(self, wait_for_elem, probe_timeout)
         
         # Instructions on how to install here:
         # https://stackoverflow.com/questions/15316304/open-tor-browser-with-selenium
@@ -164,39 +185,68 @@ class Flight_Scraper(object):
     # Remove login prompt
     def supress_login_prompt(self):
         
-        # Remove annoying login prompt if it exists
-        try:
-            xpath = "//div[contains(@class, 'LoginPrompt')]"
-            self.browser.find_element_by_xpath(xpath)
-        except:
-            # If it doesn't exist - do nothing
-            pass
-        else:
+        # Remove annoying login prompt if it exists (if it doesn't exist - do nothing)
+        xpath = "//div[contains(@class, 'LoginPrompt')]"
+        
+        if self.waits.probe(By.XPATH, xpath) is not None:
             # If it exists close it
             css_selector_tag = "button.bpk-close-button-65MQ0.bpk-modal__close-button-2a-Xb"
             self.browser.find_element_by_css_selector(css_selector_tag).click()
         
         return
     
+    # Grab the page source in one go (and save it, if required)
+    def page_source(self, name):
+        
+        page_source = self.browser.page_source
+        
+        if self.save_pages is not None:
+            page_parser.save_page(self.save_pages, name, page_source)
+        
+        return page_source
+    
+    
+    # Gather the results from the page sources (one round-trip to the browser per page instead of one per element)
+    def parse_page(self, city_from, city_to, date):
+        
+        # Price of the best offer (None if a flight cannot be found on that day)
+        price = page_parser.parse_flight_results(self.page_source('flight_results'))
+        
+        if price is None:
+            # No flight found!
+            operator, dep_time, arr_time, price = "None", "None", "None", NO_FLIGHT_PRICE
+            
+        else:
+            # Click the go-to button of the best offer, and open its summary
+            xpath_tag = "//li[contains(@class, day-list-item.ItinerariesContainer)]//div//div//article"
+            offer = self.browser.find_element_by_xpath(xpath_tag)
+            
+            xpath_tag = "//button[@class='bpk-button CTASection__cta-button-JozPr']"
+            offer.find_element_by_xpath(xpath_tag).click()
+            
+            css_selector = 'div.ItineraryLeg__leg-summary-container-qSDzV.clearfix'
+            self.browser.find_element_by_css_selector(css_selector).click()
+            
+            # Operator, departure and arrival times from the summary
+            operator, dep_time, arr_time = page_parser.parse_flight_summary(self.page_source('flight_summary'))
+        
+        return [Flight_Record(city_from, city_to, date, operator, dep_time, arr_time, price, 1)]
+    
+    
     # Gather the results
     def scrape_page(self, city_from, city_to, date):
         
         # There's a chance that a flight cannot be found on that day
         
-        try: # Check if there are no flights on that day
-            css_selector_tag = "div.fss-fxo-legs"
-            self.browser.find_element_by_css_selector(css_selector_tag)
+        # Check if there are no flights on that day
+        css_selector_tag = "div.fss-fxo-legs"
+        
+        if self.waits.probe(By.CSS_SELECTOR, css_selector_tag) is not None:
             
             # No flight found!
-            df = pd.DataFrame({"city_from" : city_from,
-                               "city_to" : city_to,
-                               "date" : date,
-                               "flight" : "None",
-                               "departure" : "None",
-                               "arrival": "None",
-                               "price" : 99999}, index = [0])
-            
-        except:
+            record = Flight_Record(city_from, city_to, date, "None", "None", "None", NO_FLIGHT_PRICE, 1)
+            
+        else:
             # Grab the best offer (automatically sorted)
             xpath_tag = "//li[contains(@class, day-list-item.ItinerariesContainer)]//div//div//article"
             offer = self.browser.find_element_by_xpath(xpath_tag)
@@ -206,7 +256,7 @@ class Flight_Scraper(object):
             price_text = offer.find_element_by_xpath(xpath_tag).text
             
             # Get numbers delimited by word boundaries (space, period, comma), i.e. the price
-            price = int(re.findall(r'\b\d+\b', price_text)[0])
+            price = page_parser.flight_price(price_text)
             
             # Click the go-to button
             xpath_tag = "//button[@class='bpk-button CTASection__cta-button-JozPr']"
@@ -229,17 +279,57 @@ class Flight_Scraper(object):
             dep_time = times[0] # departure time
             arr_time = times[1] # Arrival time
             
-            # concatenate results
-            df = pd.DataFrame({"city_from" : city_from,
-                               "city_to" : city_to,
-                               "date" : date,
-                               "flight" : operator,
-                               "departure" : dep_time,
-                               "arrival": arr_time,
-                               "price" : price}, index = [0])
+            record = Flight_Record(city_from, city_to, date, operator, dep_time, arr_time, price, 1)
+        
+        
+        return [record]
+    
+    
+    # Gather operator, departure, arrival time and price of the top_n offers from their tickets on the results list
+    # (the offers are not opened, so all of them come from a single results page)
+    def scrape_offers(self):
+        
+        # Check if there are no flights on that day
+        css_selector_tag = "div.fss-fxo-legs"
+        
+        if self.waits.probe(By.CSS_SELECTOR, css_selector_tag) is not None:
+            return []
+        
+        # Grab the best offers (automatically sorted)
+        xpath_tag = "//li[contains(@class, day-list-item.ItinerariesContainer)]//div//div//article"
+        offers = self.browser.find_elements_by_xpath(xpath_tag)[:self.top_n]
+        
+        rows = []
+        
+        for offer in offers:
+            
+            # Operator from the airline logo
+            xpath_tag = ".//div[contains(@class, 'LegLogo')]//img"
+            operator = offer.find_element_by_xpath(xpath_tag).get_attribute("alt")
+            
+            # Departure and arrival times
+            xpath_tag = ".//span[contains(@class, 'LegInfo_routePartialTime')]"
+            times = [elem.text for elem in offer.find_elements_by_xpath(xpath_tag)]
+            
+            # Price
+            xpath_tag = ".//a[contains(@class, 'CTASection__total-price')]"
+            price = page_parser.flight_price(offer.find_element_by_xpath(xpath_tag).text)
+            
+            rows.append((operator, times[0], times[1], price))
         
+        return rows
+    
+    
+    # Records of the offers of a query, ranked as sorted by the website (a single one if there are no flights)
+    @staticmethod
+    def offer_records(city_from, city_to, date, rows):
         
-        return df
+        if not rows:
+            # No flight found!
+            rows = [("None", "None", "None", NO_FLIGHT_PRICE)]
+        
+        return [Flight_Record(city_from, city_to, date, operator, dep_time, arr_time, price, rank)
+                for rank, (operator, dep_time, arr_time, price) in enumerate(rows, 1)]
     
     
     # Check for exception on start
@@ -247,13 +337,15 @@ class Flight_Scraper(object):
         
         try:
             # Fire up the main page
-            self.browser.get('https://www.skyscanner.com')
+            self.browser.get(self.url)
             
-            sleep(self.wait_for_elem + 1) # Wait to see if the timeout exception will be thrown
+            # Wait until the search form is usable (a timeout exception will be thrown otherwise)
+            self.waits.until_loaded()
+            self.waits.until(ec.visibility_of_element_located((By.ID, "fsc-origin-search")))
             
             return False
         
-        except TimeoutException or WebDriverException:
+        except (TimeoutException, WebDriverException):
               
             return True
     
@@ -261,77 +353,210 @@ class Flight_Scraper(object):
     # Refresh on timeout or webdriver exception
     def refresh(self):
         
+        t = time()
+        failed = False
+        
         # Keep refreshing until there's no javascript alert or a captcha
         while self.exception_on_start():
             
+            failed = True
+            
+            # Close the current browser (it may have already crashed)
+            try:
+                self.browser.quit()
+            except WebDriverException:
+                pass
+            
             # Fire up a new browser
-            self.browser = TorBrowserDriver(DRIVER_PATH)
+            self.browser = self.new_browser()
             self.browser.implicitly_wait(self.implicit_wait) 
+        
+        # Time to recover from the failure
+        if failed:
+            self.waits.timings['recover'].append(time() - t)
     
         return
     
     
-    # Main
-    def run(self, inputs):
+    # Fire up a browser and set up the search form (kept alive across searches)
+    def start(self, no_adults):
         
         # Fire up a new browser
-        self.browser = TorBrowserDriver(DRIVER_PATH)
-        self.browser.implicitly_wait(self.implicit_wait) 
+        with self.waits.timed('start_browser'):
+            self.browser = self.new_browser()
+            self.browser.implicitly_wait(self.implicit_wait) 
         
         # Refresh on error
-        self.refresh()
+        with self.waits.timed('load_homepage'):
+            self.refresh()
         
-        # We want one-way flights
-        self.browser.find_element_by_id("fsc-trip-type-selector-one-way").click()
+        with self.waits.timed('set_up_form'):
             
-        # We want prices in euros
-        self.set_currency()
+            # We want one-way flights
+            self.browser.find_element_by_id("fsc-trip-type-selector-one-way").click()
+                
+            # We want prices in euros
+            self.set_currency()
+            
+            # Enter traveller info
+            self.enter_traveller_info(no_adults)
+            self.no_adults = no_adults
+        
+        # The search form is ready on the homepage
+        self.on_homepage = True
+        
+        return
+    
+    
+    # Convert a date (dd/mm/yyyy) to the yymmdd format of the results urls
+    @staticmethod
+    def url_date(date):
+        return date[8:10] + date[3:5] + date[:2]
+    
+    
+    # Results url of another date of the same route (None if the url has no date segment)
+    def results_url(self, url, date):
+        
+        if len(RESULTS_DATE.findall(url)) != 1:
+            return None
+        
+        return RESULTS_DATE.sub('/' + self.url_date(date) + '/', url)
+    
+    
+    # Search through the homepage form
+    def search_by_form(self, city_from, city_to, date):
+        
+        # Go (back) to the homepage, unless we are already there (i.e. right after start)
+        if not self.on_homepage:
+            with self.waits.timed('load_homepage'):
+                self.browser.get(self.url)
+        
+        with self.waits.timed('enter_route'):
+            
+            # Outbound city
+            self.enter_origin(city_from)
+                
+            # Inbound city
+            self.enter_destination(city_to)
+        
+        # Flight date
+        with self.waits.timed('enter_date'):
+            self.enter_departure_date(date)
+                
+        # Search flights
+        with self.waits.timed('search'):
+            xpath_tag = "//button[contains(@class, 'SubmitButton')]"
+            self.browser.find_element_by_xpath(xpath_tag).click()
+        
+        self.on_homepage = False
+        
+        return
+    
+    
+    # Search by loading the results url of the previous search with the date replaced
+    # Returns False if there's no such url, or the site sent us elsewhere
+    def search_by_url(self, previous_url, date):
+        
+        url = self.results_url(previous_url, date)
+        
+        if url is None:
+            return False
+        
+        with self.waits.timed('load_results'):
+            self.on_homepage = False
+            self.browser.get(url)
+        
+        return RESULTS_DATE.findall(self.browser.current_url) == [self.url_date(date)]
+    
+    
+    # Wait for the results of a search and scrape them
+    def get_results(self, city_from, city_to, date):
         
-        # Enter traveller info
-        self.enter_traveller_info(inputs["no_adults"])
+        # Close login prompt (if it exists)
+        with self.waits.timed('login_prompt'):
+            self.supress_login_prompt()
         
-        # empty list to hold results
-        dfs = []
+        # Wait for the progress bar to disappear 
+        with self.waits.timed('wait_for_results'):
+            self.waits.until(ec.invisibility_of_element_located((By.XPATH, "//div[@class='day-search-progress']")))
+        
+        # Get results
+        with self.waits.timed('scrape_page'):
+            
+            # Top offers from the results list
+            if self.top_n > 1:
+                
+                if self.parse_pages:
+                    rows = page_parser.parse_flight_offers(self.page_source('flight_results'), self.top_n)
+                else:
+                    rows = self.scrape_offers()
+                
+                return self.offer_records(city_from, city_to, date, rows)
+            
+            # Best offer, with the details from its summary
+            if self.parse_pages:
+                return self.parse_page(city_from, city_to, date)
+            
+            return self.scrape_page(city_from, city_to, date)
+    
+    
+    # Search for all city pairs and dates of the inputs on an already started browser, yielding the records of each query
+    # (city pair and date, in the order of the inputs) as soon as it is done
+    def iter_search(self, inputs):
         
         # Iterate over all city pairs and dates
         for city_from in inputs["city_from"]:
             for city_to in inputs["city_to"]:
-               
-                # Outbound city
-                self.enter_origin(city_from)
-                    
-                # Inbound city
-                self.enter_destination(city_to)
+                
+                # Results url of the previous date of the route
+                previous_url = None
                 
                 for date in inputs["departure_dates"]:
                     
-                    # Flight date
-                    self.enter_departure_date(date)
-                            
-                    # Search flights
-                    xpath_tag = "//button[contains(@class, 'SubmitButton')]"
-                    self.browser.find_element_by_xpath(xpath_tag).click()
+                    results = None
                     
-                    # Close login prompt (if it exists)
-                    self.supress_login_prompt()
+                    # Fast path: one results page load per date
+                    if self.fast_path and previous_url is not None:
+                        try:
+                            if self.search_by_url(previous_url, date):
+                                results = self.get_results(city_from, city_to, date)
+                        except (TimeoutException, WebDriverException):
+                            pass
                     
-                    # Wait for the progress bar to disappear 
-                    wait = WebDriverWait(self.browser, self.wait_for_elem)
-                    wait.until(ec.invisibility_of_element_located((By.XPATH, "//div[@class='day-search-progress']")))
+                    # Fall back to the form on the homepage
+                    if results is None:
+                        self.search_by_form(city_from, city_to, date)
+                        results = self.get_results(city_from, city_to, date)
                     
-                    # Get results and put them to list
-                    dfs.append(self.scrape_page(city_from, city_to, date))
-                
-                    # Go back to homepage
-                    self.browser.get('https://www.skyscanner.com')
+                    previous_url = self.browser.current_url
                     
+                    yield results
+    
+    
+    # Search for all city pairs and dates of the inputs on an already started browser
+    def search(self, inputs):
+        return [record for results in self.iter_search(inputs) for record in results]
+    
+    
+    # Close the browser
+    def stop(self):
+        
+        self.browser.quit()
+        
+        return
+    
+    
+    # Main
+    def run(self, inputs):
+        
+        self.start(inputs["no_adults"])
+        
+        records = self.search(inputs)
+        
         # Close window
-        self.browser.quit()        
-            
-        # Gather results
-        df = pd.concat(dfs, ignore_index = True)        
+        self.stop()
         
-        return df
+        return to_frame(records, 'flight')
     
     
 if __name__ == "__main__": 
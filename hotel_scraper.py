@@ -3,52 +3,64 @@ DRIVER_PATH = '/home/miltos/Downloads/tor-browser-linux64-8.0.8_en-US/tor-browse
 
 from tbselenium.tbdriver import TorBrowserDriver
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.common.by import By
+from waits import Wait_Strategy
+from records import Hotel_Record, to_frame
+import page_parser
 
 from datetime import datetime as dt
-import pandas as pd
-from time import sleep
+from time import time
+
+
+# Fire up a new Tor browser
+def tor_browser():
+    return TorBrowserDriver(DRIVER_PATH)
 
 
 class Hotel_Scraper(object):
     
-    def __init__(self):
-        
-        self.url = "https://www.trivago.com/"
-        self.implicit_wait = 5 # Wait in between actions
-        self.wait_for_elem = 20 # Wait up to 20 seconds for an element to appear, be clickable, etc.
+    def __init__(self, implicit_wait = 5, wait_for_elem = 20, probe_timeout = 1, parse_pages = False, save_pages = None, top_n = 1,
+                 url = "https://www.trivago.com/", new_browser = tor_browser):
+        
+        self.url = url
+        self.new_browser = new_browser # Returns a new browser (a Tor browser by default, a headless one for the stand-in site)
+        self.implicit_wait = implicit_wait # Wait in between actions
+        self.wait_for_elem = wait_for_elem # Wait up to 20 seconds for an element to appear, be clickable, etc.
+        self.parse_pages = parse_pages # Parse the page source in-process instead of reading each element from the browser
+        self.save_pages = save_pages # Directory to save the parsed page sources to (fixtures of the parsers), if any
+        self.top_n = top_n # No. of offers to keep per query
+        
+        # Explicit waits, short probes for elements that may not exist, and per-step timings
+        self.waits = Wait_Strategy(self, wait_for_elem, probe_timeout)
     
 
     # Check whether a captcha has appeared
     def is_captcha(self):
         
-        try:
-            css_selector_tag = 'main.main-content > section.pos-relative.clearfix > div.centerwrapper--narrow.m-0-auto > div.gutter-box.mb-gutter-doubled.bg-white.border-radius.opacity-high.ta-center > h2.h2'
-            self.browser.find_element_by_css_selector(css_selector_tag)
-            return True
-        except:
-            # No captcha mentioned
-            return False
+        css_selector_tag = 'main.main-content > section.pos-relative.clearfix > div.centerwrapper--narrow.m-0-auto > div.gutter-box.mb-gutter-doubled.bg-white.border-radius.opacity-high.ta-center > h2.h2'
+        
+        # No captcha mentioned if it doesn't show up
+        return self.waits.probe(By.CSS_SELECTOR, css_selector_tag) is not None
 
 
     # Check whether a 'enable javascript' msg has appeared
     def is_js_alert(self):
         
-        try:
-            # Try and get the alert on the top of the page
-            css_selector_tag = 'body > span > div.alert.alert--info.alert--top > p.alert__message > a'
-            alert = self.browser.find_element_by_css_selector(css_selector_tag).get_attribute("href")
-            # Does it say anything about javascript?
-            if 'javascript' in alert:
-                return True
-        except:
-            # No js. alert
+        # Try and get the alert on the top of the page
+        css_selector_tag = 'body > span > div.alert.alert--info.alert--top > p.alert__message > a'
+        alert = self.waits.probe(By.CSS_SELECTOR, css_selector_tag)
+        
+        # No js. alert
+        if alert is None:
             return False
         
+        # Does it say anything about javascript?
+        return 'javascript' in (alert.get_attribute("href") or '')
+        
     # Set country to USA
     def set_country(self):
         
@@ -70,8 +82,10 @@ class Hotel_Scraper(object):
         # Set it to EURO
         currency_btn.select_by_value("EUR")
         
-        # Wait a bit
-        sleep(5)
+        # Wait until the page has been reloaded with the new currency
+        self.waits.until(lambda browser: Select(browser.find_element_by_css_selector("select#currency")) \
+                                             .first_selected_option.get_attribute("value") == "EUR")
+        self.waits.until_loaded()
         
         return
     
@@ -79,17 +93,29 @@ class Hotel_Scraper(object):
     # Refresh on bot or js alert
     def refresh(self):
         
+        t = time()
+        failed = False
+        
         # Keep refreshing until there's no javascript alert or a captcha
         while self.is_captcha() or self.is_js_alert():
             
-            # Close the current browser
-            self.browser.close()
+            failed = True
+            
+            # Close the current browser (it may have already crashed)
+            try:
+                self.browser.quit()
+            except WebDriverException:
+                pass
             
             # Fire up a new browser
-            self.browser = TorBrowserDriver(DRIVER_PATH)
+            self.browser = self.new_browser()
             self.browser.implicitly_wait(self.implicit_wait) 
             self.browser.set_window_size(1024, 768)
             self.browser.get(self.url)
+        
+        # Time to recover from the bot or js alert
+        if failed:
+            self.waits.timings['recover'].append(time() - t)
     
         return
     
@@ -99,6 +125,7 @@ class Hotel_Scraper(object):
         # Destination input
         css_selector_tag = "input#horus-querytext"
         destination_input = self.browser.find_element_by_css_selector(css_selector_tag)
+        destination_input.clear() # A previous search of the same session may have left its destination in
         destination_input.send_keys(destination)
         
         # Wait until the selection pop-up becomes available
@@ -240,17 +267,21 @@ class Hotel_Scraper(object):
 #        return
     
     
-    # Get the best offer according to website
-    def get_offer(self, destination, check_in_date, check_out_date):    
-        
-        # Wait until the loader exits
-        xpath_tag = "//span[@class='loader-text.center-x']"
-        wait = WebDriverWait(self.browser, self.wait_for_elem)
-        wait.until(ec.invisibility_of_element_located((By.XPATH, xpath_tag)))
+    # Get hotel name, stars, deal website and price of the top_n offers from the browser
+    def scrape_offers(self):
         
-        # Grab the first result (already sorted)
+        # Grab the first results (already sorted)
         xpath_tag = "//li[@class='hotel-item item-order__list-item js_co_item']"
-        offer = self.browser.find_element_by_xpath(xpath_tag)
+        offers = self.browser.find_elements_by_xpath(xpath_tag)[:self.top_n]
+        
+        if not offers:
+            raise NoSuchElementException('No offer on the page')
+        
+        return [self.scrape_offer(offer) for offer in offers]
+    
+    
+    # Get hotel name, stars, deal website and price of an offer
+    def scrape_offer(self, offer):
         
         # Get hotel name
         css_selector_tag = "span.item-link.name__copytext"
@@ -265,92 +296,149 @@ class Hotel_Scraper(object):
         css_selector_tag = "em.item__deal-best-ota.block.fs-normal.cur-pointer--hover"
         website = offer.find_element_by_css_selector(css_selector_tag).text
         
-        # Get total price
-        try:
+        # Get total price (the offer has already been rendered, so the probe does not need to wait)
+        css_selector_tag = "em.item__per-night.fs-normal > span"
+        per_night = self.waits.probe(By.CSS_SELECTOR, css_selector_tag, timeout = 0, root = offer)
+        
+        if per_night is not None:
             # One night stays
-            css_selector_tag = "em.item__per-night.fs-normal > span"
-            price = offer.find_element_by_css_selector(css_selector_tag).text
+            price = per_night.text
             
-        except:
+        else:
             # More than one night stays (different element is needed)
             css_selector_tag = "strong.item__best-price.price_min"
             price = offer.find_element_by_css_selector(css_selector_tag).text
             
         # Remove Euro sign, remove thousands separator, and convert to int
-        price = int(price.replace("€","").replace(".","").replace(",",""))
+        price = page_parser.hotel_price(price)
         
-        # concatenate results
-        df = pd.DataFrame({"city" : destination,
-                           "check_in" : check_in_date,
-                           "check_out" : check_out_date,
-                           "hotel" : name,
-                           "stars" : stars,
-                           "offered_by": website,
-                           "price" : price}, index = [0])
+        return name, stars, website, price
+    
+    
+    # Grab the page source in one go (and save it, if required)
+    def page_source(self, name):
+        
+        page_source = self.browser.page_source
+        
+        if self.save_pages is not None:
+            page_parser.save_page(self.save_pages, name, page_source)
         
-        return df
+        return page_source
+    
+    
+    # Get the best (top_n) offers according to website
+    def get_offer(self, destination, check_in_date, check_out_date):    
+        
+        # Wait until the loader exits
+        xpath_tag = "//span[@class='loader-text.center-x']"
+        self.waits.until(ec.invisibility_of_element_located((By.XPATH, xpath_tag)))
+        
+        if self.parse_pages:
+            # Grab the page source in one go, and get the hotel name, stars, deal website and price from it
+            rows = page_parser.parse_hotel_offers(self.page_source('hotel_results'), self.top_n)
+        else:
+            rows = self.scrape_offers()
+        
+        # One record per offer, ranked as sorted by the website
+        return [Hotel_Record(destination, check_in_date, check_out_date, name, stars, website, price, rank)
+                for rank, (name, stars, website, price) in enumerate(rows, 1)]
     
 
-    # Main
-    def run(self, inputs):
+    # Fire up a browser with the main page and set it up (kept alive across searches)
+    def start(self, no_adults = None):
         
         # Fire up a browser with the main page
-        self.browser = TorBrowserDriver(DRIVER_PATH)
-        self.browser.set_window_size(1024, 768)
-        self.browser.implicitly_wait(self.implicit_wait) 
-        self.browser.get(self.url)
+        with self.waits.timed('start_browser'):
+            self.browser = self.new_browser()
+            self.browser.set_window_size(1024, 768)
+            self.browser.implicitly_wait(self.implicit_wait) 
+        
+        with self.waits.timed('load_homepage'):
+            self.browser.get(self.url)
     
-        # Refresh on js alert or bot message
-        self.refresh()
+            # Refresh on js alert or bot message
+            self.refresh()
         
-        # Change country to USA
-        self.set_country()
+        with self.waits.timed('set_up_form'):
+            
+            # Change country to USA
+            self.set_country()
+            
+            # Set to EURO currency
+            self.set_currency()
         
-        # Set to EURO currency
-        self.set_currency()
+        # The first search of the session needs the date menus to be opened differently
+        self.first_search = True
+        self.no_adults = no_adults
         
-        # Start scraping
-        first_search = True
-        # previous_check_in_date = dt.strftime(dt.now(), "%d/%m/%Y")
-        dfs = []
+        return
+    
+    
+    # Search for all destinations and date pairs of the inputs on an already started browser, yielding the records of each query
+    # (destination and date pair, in the order of the inputs) as soon as it is done
+    def iter_search(self, inputs):
         
         # Enter destination
         for destination in inputs["destinations"]:
             
-            self.enter_destination(destination, first_search)
+            with self.waits.timed('enter_destination'):
+                self.enter_destination(destination, self.first_search)
             
             for check_in_date, check_out_date in zip(inputs["start_dates"], inputs["end_dates"]):
                     
-                    # Enter check-in date
-                    xpath_tag = "//button[@data-qa='calendar-checkin']"
-                    self.enter_date(check_in_date, first_search, xpath_tag)
-                    
-                    # Enter check-out date
-                    xpath_tag = "//button[@data-qa='calendar-checkout']"
-                    self.enter_date(check_out_date, first_search, xpath_tag)
+                    with self.waits.timed('enter_dates'):
+                        
+                        # Enter check-in date
+                        xpath_tag = "//button[@data-qa='calendar-checkin']"
+                        self.enter_date(check_in_date, self.first_search, xpath_tag)
+                        
+                        # Enter check-out date
+                        xpath_tag = "//button[@data-qa='calendar-checkout']"
+                        self.enter_date(check_out_date, self.first_search, xpath_tag)
                      
                     # Fill in room info on the first time only (saved afterwards)
-                    #if first_search:
+                    #if self.first_search:
                     #    self.enter_room_info(inputs["no_adults"])
                     
                     # Search
-                    css_selector_tag = "button.btn.btn--primary.js-search-button.horus-btn-search"
-                    self.browser.find_element_by_css_selector(css_selector_tag).click()
+                    with self.waits.timed('search'):
+                        css_selector_tag = "button.btn.btn--primary.js-search-button.horus-btn-search"
+                        self.browser.find_element_by_css_selector(css_selector_tag).click()
                     
                     # Get offer
-                    dfs.append(self.get_offer(destination, check_in_date, check_out_date))
+                    with self.waits.timed('get_offer'):
+                        results = self.get_offer(destination, check_in_date, check_out_date)
                     
-                    # Set the 'first time search' flag to false, and update the previous check in date
-                    first_search = False
-                    # previous_check_in_date = check_in_date
+                    # Set the 'first time search' flag to false
+                    self.first_search = False
                     
+                    yield results
+    
+    
+    # Search for all destinations and date pairs of the inputs on an already started browser
+    def search(self, inputs):
+        return [record for results in self.iter_search(inputs) for record in results]
+    
+    
+    # Close the browser
+    def stop(self):
+        
+        self.browser.quit()
+        
+        return
+    
+
+    # Main
+    def run(self, inputs):
+        
+        self.start(inputs["no_adults"])
+        
+        records = self.search(inputs)
+        
         # Close window
-        self.browser.quit()        
-                
-        # Gather results
-        df = pd.concat(dfs, ignore_index = True)    
+        self.stop()        
         
-        return df
+        return to_frame(records, 'hotel')
         
     
 if __name__ == "__main__": 
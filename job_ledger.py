@@ -0,0 +1,100 @@
+import sqlite3
+import hashlib
+import json
+from time import time
+
+
+class Job_Ledger(object):
+
+    # Open (or create) the ledger: one row per scraper query, keyed by a stable hash of the query
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                     job_hash TEXT PRIMARY KEY,
+                                     status TEXT NOT NULL,
+                                     attempts INTEGER NOT NULL DEFAULT 0,
+                                     error TEXT,
+                                     updated REAL NOT NULL)''')
+
+
+    # Stable hash of a query, e.g. ('flight', city_from, city_to, date, no_adults)
+    @staticmethod
+    def hash(key):
+        return hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+
+
+    # Hashes of the queries that have been written to disk
+    def completed(self):
+        return self.with_status('completed')
+
+
+    # Hashes of the queries with any of the given statuses
+    def with_status(self, *statuses):
+
+        rows = self.conn.execute("SELECT job_hash FROM jobs WHERE status IN ({})".format(', '.join('?' * len(statuses))),
+                                 statuses)
+
+        return {job_hash for (job_hash, ) in rows}
+
+
+    # Most times any of the given queries has been dispatched
+    def attempts(self, job_hashes):
+
+        job_hashes = list(job_hashes)
+        rows = self.conn.execute("SELECT MAX(attempts) FROM jobs WHERE job_hash IN ({})".format(', '.join('?' * len(job_hashes))),
+                                 job_hashes)
+
+        return rows.fetchone()[0] or 0
+
+
+    # Give the queries with the given status a fresh set of attempts (i.e. release them from quarantine)
+    def release(self, status, new_status = 'failed'):
+
+        with self.conn:
+            self.conn.execute("UPDATE jobs SET status = ?, attempts = 0, updated = ? WHERE status = ?", (new_status, time(), status))
+
+        return
+
+
+    # Number of failed / quarantined queries per status and error, most frequent first
+    def failures(self):
+
+        rows = self.conn.execute('''SELECT status, error, COUNT(*), MAX(attempts) FROM jobs
+                                    WHERE status IN ('failed', 'quarantined')
+                                    GROUP BY status, error ORDER BY COUNT(*) DESC''')
+
+        return rows.fetchall()
+
+
+    # Set the status of a number of queries in a single transaction
+    def mark(self, job_hashes, status, error = None):
+
+        # Dispatching a query counts as an attempt
+        attempt = 1 if status == 'in_flight' else 0
+        now = time()
+
+        with self.conn:
+            self.conn.executemany('''INSERT INTO jobs (job_hash, status, attempts, error, updated) VALUES (?, ?, ?, ?, ?)
+                                     ON CONFLICT(job_hash) DO UPDATE SET status = excluded.status,
+                                                                         attempts = attempts + excluded.attempts,
+                                                                         error = excluded.error,
+                                                                         updated = excluded.updated''',
+                                  [(job_hash, status, attempt, error, now) for job_hash in job_hashes])
+
+        return
+
+
+    # Number of queries per status
+    def summary(self):
+
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+
+        return dict(rows.fetchall())
+
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,682 @@
+import pandas as pd
+import numpy as np
+
+import pulp as plp
+import os
+from collections import defaultdict
+from datetime import datetime as dt
+from datetime import timedelta
+from itertools import combinations
+from time import time
+
+from constants import DATE_FORMAT, NO_FLIGHT_PRICE
+
+
+# Model construction time budget (in seconds) for the 30 cities x 90 days benchmark
+BUILD_TIME_TARGET = 30
+
+
+# Drop the flights and stays that cannot be part of any trip, before the variables are generated:
+# - the 'no flight' placeholders of the scraper, and the flights and stays outside the start / end dates
+# - flights on the start date not leaving home, on the end date not returning home, or during the first min_stay nights
+# - stays (away from home) shorter than min_stay nights, or longer than max_stay nights (if None, the longest stay that leaves
+#   min_stay nights for each of the other min_cities_to_visit - 1 cities)
+# - flights with no stay to check out of at their origin or to check in to at their destination, and stays with no flight to
+#   arrive with or to leave with (repeated until nothing changes)
+# Only flights and stays that no trip can use are dropped, so the optimum is unchanged (the 'no flight' placeholders are not
+# flights: a trip can only use one if there is no trip otherwise)
+# Returns the remaining flights and hotels, and the no. of flights and stays dropped per rule
+def presolve(flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit, max_stay = None):
+
+    t_start = dt.strptime(start_date, DATE_FORMAT)
+    no_days = (dt.strptime(end_date, DATE_FORMAT) - t_start).days
+
+    if max_stay is None:
+        max_stay = no_days - (min_cities_to_visit - 1) * min_stay
+
+    flight_day = (pd.to_datetime(flights['date'], format = DATE_FORMAT) - t_start).dt.days
+    check_in = (pd.to_datetime(hotels['check_in'], format = DATE_FORMAT) - t_start).dt.days
+    check_out = (pd.to_datetime(hotels['check_out'], format = DATE_FORMAT) - t_start).dt.days
+    nights = check_out - check_in
+    away = hotels['city'] != home
+
+    flight_rules = [('no flight', flights['price'] >= NO_FLIGHT_PRICE),
+                    ('outside dates', (flight_day < 0) | (flight_day > no_days)),
+                    ('start / end date', ((flight_day == 0) & (flights['city_from'] != home)) | \
+                                         ((flight_day == no_days) & (flights['city_to'] != home))),
+                    ('first stay', (flight_day > 0) & (flight_day < min_stay))]
+
+    hotel_rules = [('outside dates', (check_in < 0) | (check_out > no_days)),
+                   ('stay length', away & ((nights < min_stay) | (nights > max_stay)))]
+
+    report = []
+    flights_kept = pd.Series(True, index = flights.index)
+    hotels_kept = pd.Series(True, index = hotels.index)
+
+    for rule, dropped in flight_rules:
+        report.append((rule, (flights_kept & dropped).sum(), 0))
+        flights_kept &= ~dropped
+
+    for rule, dropped in hotel_rules:
+        report.append((rule, 0, (hotels_kept & dropped).sum()))
+        hotels_kept &= ~dropped
+
+    # Flights and stays that do not connect (dropping some may disconnect others)
+    flight_origins = pd.MultiIndex.from_arrays([flights['city_from'], flights['date']])
+    flight_destinations = pd.MultiIndex.from_arrays([flights['city_to'], flights['date']])
+    hotel_check_ins = pd.MultiIndex.from_arrays([hotels['city'], hotels['check_in']])
+    hotel_check_outs = pd.MultiIndex.from_arrays([hotels['city'], hotels['check_out']])
+
+    first_flight = (flights['city_from'] == home) & (flight_day == 0)
+    last_flight = (flights['city_to'] == home) & (flight_day == no_days)
+
+    no_flights, no_hotels = 0, 0
+
+    while True:
+
+        connected = (first_flight | flight_origins.isin(hotel_check_outs[hotels_kept.to_numpy()])) & \
+                    (last_flight | flight_destinations.isin(hotel_check_ins[hotels_kept.to_numpy()]))
+
+        reachable = hotel_check_ins.isin(flight_destinations[flights_kept.to_numpy()]) & \
+                    hotel_check_outs.isin(flight_origins[flights_kept.to_numpy()])
+
+        dropped_flights = flights_kept & ~connected
+        dropped_hotels = hotels_kept & ~reachable
+
+        if not dropped_flights.any() and not dropped_hotels.any():
+            break
+
+        no_flights += dropped_flights.sum()
+        no_hotels += dropped_hotels.sum()
+
+        flights_kept &= connected
+        hotels_kept &= reachable
+
+    report.append(('not connected', no_flights, no_hotels))
+
+    report = pd.DataFrame(report, columns = ['rule', 'flights', 'hotels'])
+
+    return flights[flights_kept], hotels[hotels_kept], report
+
+
+# Formulations of the minimum stay (and of the links between flights and stays):
+# - 'big_m': flights out of a city are forbidden for min_stay - 1 dates after arriving, with big-M constraints, and every stay
+#   needs a flight in on its check in date and a flight out on its check out date (see add_connection_constraints)
+# - 'flow': stays shorter than min_stay nights have no variable, and the flights in to / out of each (city, date) equal the
+#   stays checking in / out there (see add_flow_constraints)
+FORMULATIONS = ['big_m', 'flow']
+
+
+class Model_Builder(object):
+
+    # Initialize
+    def __init__(self, flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit, formulation = 'big_m'):
+
+        if formulation not in FORMULATIONS:
+            raise ValueError('Invalid formulation')
+
+        self.home = home
+        self.start_date = start_date
+        self.end_date = end_date
+        self.min_stay = min_stay
+        self.min_cities_to_visit = min_cities_to_visit
+        self.formulation = formulation
+
+        if formulation == 'flow':
+            flights, hotels = self.flow_rows(flights, hotels)
+
+        self.flights = flights.reset_index(drop = True)
+        self.hotels = hotels.reset_index(drop = True)
+
+        # Variable keys, in the same (row) order as the dataframes
+        self.flight_keys = list(zip(self.flights['city_from'], self.flights['city_to'], self.flights['date']))
+        self.hotel_keys = list(zip(self.hotels['city'], self.hotels['check_in'], self.hotels['check_out']))
+
+        # Cities and dates (every day from the first to the last date, so that positions are days even with no flights on some
+        # dates) that will be needed for the constraints
+        self.city_list = sorted(self.flights['city_from'].unique())
+
+        flight_dates = [dt.strptime(date, DATE_FORMAT) for date in self.flights['date'].unique()]
+        first_date = min(flight_dates + [dt.strptime(start_date, DATE_FORMAT)])
+        last_date = max(flight_dates + [dt.strptime(end_date, DATE_FORMAT)])
+
+        self.date_list = [dt.strftime(first_date + timedelta(n), DATE_FORMAT) for n in range((last_date - first_date).days + 1)]
+        self.date_pos = {date: idx for idx, date in enumerate(self.date_list)}
+
+        self.build_indexes()
+
+
+    # Group the flight and hotel keys once, so that each constraint family is a dict lookup
+    def build_indexes(self):
+
+        self.flights_by_date = defaultdict(list)
+        self.flights_by_origin = defaultdict(list)       # (city_from, date) -> flights
+        self.flights_by_destination = defaultdict(list)  # (city_to, date) -> flights
+        self.flights_by_route = defaultdict(list)        # (city_from, city_to) -> flights
+
+        for key in self.flight_keys:
+            from_city, to_city, at_date = key
+            self.flights_by_date[at_date].append(key)
+            self.flights_by_origin[from_city, at_date].append(key)
+            self.flights_by_destination[to_city, at_date].append(key)
+            self.flights_by_route[from_city, to_city].append(key)
+
+        self.hotels_by_city = defaultdict(list)
+        self.hotels_by_check_in = defaultdict(list)      # (city, check_in) -> stays
+        self.hotels_by_check_out = defaultdict(list)     # (city, check_out) -> stays
+
+        for key in self.hotel_keys:
+            city, check_in, check_out = key
+            self.hotels_by_city[city].append(key)
+            self.hotels_by_check_in[city, check_in].append(key)
+            self.hotels_by_check_out[city, check_out].append(key)
+
+        return
+
+
+    # Flights and stays the flow formulation has variables for: flights from home on the start date and to home on the end
+    # date only, and stays away from home of min_stay nights or more between the start and end dates
+    def flow_rows(self, flights, hotels):
+
+        home = self.home
+
+        flights = flights[((flights['city_from'] != home) | (flights['date'] == self.start_date)) & \
+                          ((flights['city_to'] != home) | (flights['date'] == self.end_date))]
+
+        t_start = dt.strptime(self.start_date, DATE_FORMAT)
+        no_days = (dt.strptime(self.end_date, DATE_FORMAT) - t_start).days
+
+        check_in = (pd.to_datetime(hotels['check_in'], format = DATE_FORMAT) - t_start).dt.days
+        check_out = (pd.to_datetime(hotels['check_out'], format = DATE_FORMAT) - t_start).dt.days
+
+        hotels = hotels[(hotels['city'] != home) & (check_in >= 0) & (check_out <= no_days) & \
+                        (check_out - check_in >= self.min_stay)]
+
+        return flights, hotels
+
+
+    # Return the dates following (up to no_dates of them) a given date for the entire trip
+    def dates_after(self, at_date, no_dates = None):
+
+        idx = self.date_pos[at_date] + 1
+
+        if no_dates is None:
+            return self.date_list[idx:]
+
+        return self.date_list[idx: idx + no_dates]
+
+
+    # Instantiate the problem and its decision variables
+    def add_variables(self):
+
+        self.model = plp.LpProblem("Traveling Costs", plp.LpMinimize)
+
+        self.getting_flight = plp.LpVariable.dicts("getting_flight", self.flight_keys, cat = 'Binary')
+        self.sleeping_at = plp.LpVariable.dicts("sleeping_at", self.hotel_keys, cat = 'Binary')
+
+        return
+
+
+    # Starting flight only from home at the start date, returning flight only to home at the end date
+    def add_endpoint_constraints(self):
+
+        home, start_date, end_date = self.home, self.start_date, self.end_date
+        x = self.getting_flight
+
+        model = self.model
+
+        model += plp.lpSum(x[key] for key in self.flights_by_origin[home, start_date]) == 1, \
+        "Starting flight only from home at start date constraint 1/2"
+
+        # (the == 0 constraints are left out if there are no such flights, e.g. after presolve)
+        forbidden = [x[key] for key in self.flights_by_date[start_date] if key[0] != home and key[1] != home]
+
+        if forbidden:
+            model += plp.lpSum(forbidden) == 0, "Starting flight only from home at start date constraint 2/2"
+
+        model += plp.lpSum(x[key] for key in self.flights_by_destination[home, end_date]) == 1, \
+        "Returning flight only to home at end date - constraint 1/2"
+
+        forbidden = [x[key] for key in self.flights_by_date[end_date] if key[1] != home]
+
+        if forbidden:
+            model += plp.lpSum(forbidden) == 0, "Returning flight only to home at end date - constraint 2/2"
+
+        return
+
+
+    # Manage connections: Flight date must match check_in date for inbound city and check_out date for the outbound city
+    def add_connection_constraints(self):
+
+        home, start_date, end_date = self.home, self.start_date, self.end_date
+        x, y = self.getting_flight, self.sleeping_at
+        pos = self.date_pos
+
+        model = self.model
+
+        for key in self.flight_keys:
+            from_city, to_city, flight_date = key
+            flight_pos = pos[flight_date]
+
+            initial_flight = from_city == home and flight_date == start_date
+            final_flight = to_city == home and flight_date == end_date
+
+            # Stays at the origin that end on the flight date / stays at the destination that start on it
+            prior_checkouts = [y[stay] for stay in self.hotels_by_check_out[from_city, flight_date] \
+                               if stay[1] in pos and pos[stay[1]] < flight_pos]
+
+            post_checkins = [y[stay] for stay in self.hotels_by_check_in[to_city, flight_date] \
+                             if stay[2] in pos and pos[stay[2]] > flight_pos]
+
+            if initial_flight:
+                model += x[key] == plp.lpSum(post_checkins), \
+                'Check_in: traveling from {} to {} at {}'.format(from_city, to_city, flight_date)
+
+            elif final_flight:
+                model += x[key] == plp.lpSum(prior_checkouts), \
+                'Check_out: traveling from {} to {} at {}'.format(from_city, to_city, flight_date)
+
+            else:
+                model += x[key] <= plp.lpSum(prior_checkouts), \
+                'Check out: traveling from {} to {} at {}'.format(from_city, to_city, flight_date)
+
+                model += x[key] <= plp.lpSum(post_checkins), \
+                'Check_in: traveling from {} to {} at {}'.format(from_city, to_city, flight_date)
+
+        # Stays away from home need a flight arriving on their check in date and one leaving on their check out date (else a
+        # stay with no flight out escapes the minimum stay constraints), summed per (city, date) as each city is visited at
+        # most once. There are no stays at home (else they let a flight leave home in the middle of the trip)
+        home_stays = [y[key] for key in self.hotels_by_city[home]]
+
+        if home_stays:
+            model += plp.lpSum(home_stays) == 0, "No stays at home"
+
+        for city, date in self.hotels_by_check_in:
+            if city != home:
+                model += plp.lpSum(y[key] for key in self.hotels_by_check_in[city, date]) <= \
+                plp.lpSum(x[key] for key in self.flights_by_destination[city, date]), \
+                'Arriving: checking in at {} on {}'.format(city, date)
+
+        for city, date in self.hotels_by_check_out:
+            if city != home:
+                model += plp.lpSum(y[key] for key in self.hotels_by_check_out[city, date]) <= \
+                plp.lpSum(x[key] for key in self.flights_by_origin[city, date]), \
+                'Leaving: checking out at {} on {}'.format(city, date)
+
+        return
+
+
+    # At most one visit per city, at most one flight per date, travel between any two cities at most once
+    # (left out if there is at most one variable to sum, as binaries are at most one anyway)
+    def add_visit_constraints(self):
+
+        home, start_date, end_date = self.home, self.start_date, self.end_date
+        x, y = self.getting_flight, self.sleeping_at
+
+        model = self.model
+
+        for city in self.city_list:
+            if city != home and len(self.hotels_by_city[city]) > 1:
+                model += plp.lpSum(y[key] for key in self.hotels_by_city[city]) <= 1, \
+                "At most one visit at {}".format(city)
+
+        for date in self.date_list:
+            if date != start_date and date != end_date and len(self.flights_by_date[date]) > 1:
+                model += plp.lpSum(x[key] for key in self.flights_by_date[date]) <= 1, \
+                "At most one flight at {}".format(date)
+
+        # (home is the only city with two flights. One at the beginning and one at the end of the holidays)
+        away_cities = [city for city in self.city_list if city != home]
+
+        for city_1, city_2 in combinations(away_cities, 2):
+
+            flights_between = self.flights_by_route[city_1, city_2] + self.flights_by_route[city_2, city_1]
+
+            if len(flights_between) <= 1:
+                continue
+
+            model += plp.lpSum(x[key] for key in flights_between) <= 1, \
+            "Travel between {} and {} at most once".format(city_1, city_2)
+
+        return
+
+
+    # Minimum stay at each city = No flights allowed from it for N - 1 dates after arriving
+    # (left out if there are no arrivals or no departures to forbid, e.g. after presolve)
+    def add_min_stay_constraints(self):
+
+        home, start_date, end_date = self.home, self.start_date, self.end_date
+        x, y = self.getting_flight, self.sleeping_at
+
+        model = self.model
+
+        for cur_city in self.city_list:
+            if cur_city == home:
+                continue
+
+            for cur_date in self.date_list:
+                if cur_date == end_date:
+                    continue
+
+                arrivals = self.flights_by_destination[cur_city, cur_date]
+
+                forbidden_departures = [key for at_date in self.dates_after(cur_date, self.min_stay - 1) \
+                                        for key in self.flights_by_origin[cur_city, at_date]]
+
+                if not arrivals or not forbidden_departures:
+                    continue
+
+                # If arrivals == 1: departures == 0 else if arrivals == 0: departures >= 0 -> departures <= M(1 - arrivals)
+                model += plp.lpSum(x[key] for key in forbidden_departures) <= \
+                1e5 * (1 - plp.lpSum(x[key] for key in arrivals)), \
+                'Minimum stay at {} if visited on {}'.format(cur_city, cur_date)
+
+        # No flights or checkins allowed after the start date for at least N days
+        forbidden_dates = self.dates_after(start_date, self.min_stay - 1)
+
+        forbidden_flights = [x[key] for at_date in forbidden_dates for key in self.flights_by_date[at_date]]
+
+        if forbidden_flights:
+            model += plp.lpSum(forbidden_flights) == 0, 'Minimum stay on first node - flights'
+
+        forbidden_dates = set(forbidden_dates)
+
+        for cur_city in self.city_list:
+            if cur_city != home:
+
+                forbidden_checkins = [y[key] for key in self.hotels_by_check_in[cur_city, start_date] \
+                                      if key[2] in forbidden_dates]
+
+                if forbidden_checkins:
+                    model += plp.lpSum(forbidden_checkins) == 0, "Minimum stay on first node - hotels at {}".format(cur_city)
+
+        return
+
+
+    # Flow formulation: one flight leaves home (on the start date) and one returns (on the end date), and at every other city
+    # and date the flights in (out) equal the stays checking in (out), each city being visited at most once
+    # As every stay lasts min_stay nights or more, the selected flights and stays form a single trip forward in time, which
+    # makes the minimum stay, one flight per date and one trip per city pair constraints of the big-M formulation redundant
+    def add_flow_constraints(self):
+
+        home = self.home
+        x, y = self.getting_flight, self.sleeping_at
+
+        model = self.model
+
+        model += plp.lpSum(x[key] for key in self.flights_by_origin[home, self.start_date]) == 1, "Leaving home"
+        model += plp.lpSum(x[key] for key in self.flights_by_destination[home, self.end_date]) == 1, "Returning home"
+
+        for city in self.city_list:
+            if city == home:
+                continue
+
+            if len(self.hotels_by_city[city]) > 1:
+                model += plp.lpSum(y[key] for key in self.hotels_by_city[city]) <= 1, "At most one visit at {}".format(city)
+
+            for date in self.date_list:
+
+                arrivals = self.flights_by_destination[city, date]
+                check_ins = self.hotels_by_check_in[city, date]
+
+                if arrivals or check_ins:
+                    model += plp.lpSum(x[key] for key in arrivals) == plp.lpSum(y[key] for key in check_ins), \
+                    'Flow in: {} at {}'.format(city, date)
+
+                departures = self.flights_by_origin[city, date]
+                check_outs = self.hotels_by_check_out[city, date]
+
+                if departures or check_outs:
+                    model += plp.lpSum(x[key] for key in departures) == plp.lpSum(y[key] for key in check_outs), \
+                    'Flow out: {} at {}'.format(city, date)
+
+        return
+
+
+    # At least N cities must be visited: N check ins + (N + 1) flights: + 1 for the return at home node
+    def add_trip_length_constraints(self):
+
+        x, y = self.getting_flight, self.sleeping_at
+
+        total_checkins = plp.lpSum(y[key] for key in self.hotel_keys if key[0] != self.home)
+        total_flights = plp.lpSum(x.values())
+
+        model = self.model
+
+        model += total_checkins >= self.min_cities_to_visit, "No cities to visit"
+        model += total_flights >= self.min_cities_to_visit + 1, 'No flights to take'
+        model += total_checkins + 1 == total_flights, 'Match no flights with no cities'
+
+        return
+
+
+    # Total cost minimization: the price columns are zipped (in row order) against the variables
+    def add_objective(self):
+
+        flight_costs = zip((self.getting_flight[key] for key in self.flight_keys),
+                           self.flights['price'].to_numpy(dtype = float))
+
+        hotel_costs = zip((self.sleeping_at[key] for key in self.hotel_keys),
+                          self.hotels['price'].to_numpy(dtype = float))
+
+        self.model += plp.LpAffineExpression(list(flight_costs) + list(hotel_costs)), "Total cost minimization"
+
+        return
+
+
+    # Generate variables, all constraint families (of the selected formulation) and the objective
+    def build(self):
+
+        self.add_variables()
+
+        if self.formulation == 'flow':
+            self.add_flow_constraints()
+        else:
+            self.add_endpoint_constraints()
+            self.add_connection_constraints()
+            self.add_visit_constraints()
+            self.add_min_stay_constraints()
+
+        self.add_trip_length_constraints()
+        self.add_objective()
+
+        return self.model
+
+
+    # Return the flight and hotel schedules of the solved model
+    def solution(self):
+
+        flights_taken = np.array([self.getting_flight[key].varValue for key in self.flight_keys], dtype = float) > 0.5
+        hotels_booked = np.array([self.sleeping_at[key].varValue for key in self.hotel_keys], dtype = float) > 0.5
+
+        sol_flights = self.flights[flights_taken].reset_index(drop = True)
+        sol_hotels = self.hotels[hotels_booked].reset_index(drop = True)
+
+        return sol_flights, sol_hotels
+
+
+# Random flight and hotel prices for a grid of cities and consecutive dates, in the format of the scraped data
+def synthetic_data(no_cities, no_days, start_date = "07/01/2019", seed = 0):
+
+    rng = np.random.default_rng(seed)
+
+    cities = ['City_{:02d}'.format(idx) for idx in range(no_cities)]
+
+    t0 = dt.strptime(start_date, DATE_FORMAT)
+    dates = [dt.strftime(t0 + timedelta(n), DATE_FORMAT) for n in range(no_days)]
+
+    flights = pd.DataFrame([(city_from, city_to, date) \
+                            for city_from in cities for city_to in cities for date in dates \
+                            if city_from != city_to],
+                           columns = ['city_from', 'city_to', 'date'])
+    flights['price'] = rng.integers(20, 400, len(flights))
+
+    hotels = pd.DataFrame([(city, dates[i], dates[j]) \
+                           for city in cities for i in range(no_days) for j in range(i + 1, no_days)],
+                          columns = ['city', 'check_in', 'check_out'])
+    nights = hotels['check_out'].map({d: i for i, d in enumerate(dates)}) - hotels['check_in'].map({d: i for i, d in enumerate(dates)})
+    hotels['price'] = nights * rng.integers(40, 150, len(hotels))
+
+    return flights, hotels, cities[0], dates[0], dates[-1]
+
+
+# Time model construction on a synthetic grid
+def benchmark_build(no_cities = 30, no_days = 90, min_stay = 4, min_cities_to_visit = 7):
+
+    flights, hotels, home, start_date, end_date = synthetic_data(no_cities, no_days)
+
+    t = time()
+    builder = Model_Builder(flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit)
+    model = builder.build()
+    elapsed = time() - t
+
+    print("-------------------------")
+    print("Cities x dates =", no_cities, "x", no_days)
+    print("Variables =", len(builder.flight_keys) + len(builder.hotel_keys))
+    print("Constraints =", len(model.constraints))
+    print("Build time [s] =", round(elapsed, 3), "(target: {} s)".format(BUILD_TIME_TARGET))
+    print("-------------------------")
+
+    return elapsed
+
+
+# Compare the per-variable .loc objective against the bulk price vector one (default: scraped dataset sizes)
+def benchmark_objective(no_cities = 10, no_days = 32):
+
+    # 10 cities x 32 days -> 2880 flights (one per city pair and date), 4960 hotels (one per city and date pair)
+    flights, hotels, home, start_date, end_date = synthetic_data(no_cities, no_days)
+
+    builder = Model_Builder(flights, hotels, home, start_date, end_date, min_stay = 4, min_cities_to_visit = 3)
+    builder.add_variables()
+
+    flights_indexed = builder.flights.set_index(['city_from', 'city_to', 'date'])
+    hotels_indexed = builder.hotels.set_index(['city', 'check_in', 'check_out'])
+
+    t = time()
+    total_flight_costs = [builder.getting_flight[key] * flights_indexed.loc[key, "price"] for key in builder.flight_keys]
+    total_hotel_costs = [builder.sleeping_at[key] * hotels_indexed.loc[key, "price"] for key in builder.hotel_keys]
+    plp.lpSum(total_flight_costs + total_hotel_costs)
+    elapsed_loc = time() - t
+
+    t = time()
+    builder.add_objective()
+    elapsed_bulk = time() - t
+
+    print("-------------------------")
+    print("Flights / hotels =", len(builder.flight_keys), "/", len(builder.hotel_keys))
+    print("Objective build time, .loc lookups [s] =", round(elapsed_loc, 3))
+    print("Objective build time, price vectors [s] =", round(elapsed_bulk, 3))
+    print("-------------------------")
+
+    return elapsed_loc, elapsed_bulk
+
+
+# Compare the model built from all the rows against the presolved one (a share of the flights being 'no flight' placeholders)
+def benchmark_presolve(no_cities = 8, no_days = 21, min_stay = 3, min_cities_to_visit = 3, no_flight_share = 0.3):
+
+    flights, hotels, home, start_date, end_date = synthetic_data(no_cities, no_days)
+
+    rng = np.random.default_rng(1)
+    flights.loc[rng.random(len(flights)) < no_flight_share, 'price'] = NO_FLIGHT_PRICE
+
+    presolved_flights, presolved_hotels, report = presolve(flights, hotels, home, start_date, end_date, min_stay,
+                                                           min_cities_to_visit)
+
+    results = []
+
+    for name, data in [('all rows', (flights, hotels)), ('presolved', (presolved_flights, presolved_hotels))]:
+
+        t = time()
+        builder = Model_Builder(*data, home, start_date, end_date, min_stay, min_cities_to_visit)
+        model = builder.build()
+        elapsed_build = time() - t
+
+        t = time()
+        model.solve(plp.PULP_CBC_CMD(msg = False))
+        elapsed_solve = time() - t
+
+        results.append({'model': name,
+                        'variables': len(builder.flight_keys) + len(builder.hotel_keys),
+                        'constraints': len(model.constraints),
+                        'build [s]': elapsed_build,
+                        'solve [s]': elapsed_solve,
+                        'status': plp.LpStatus[model.status],
+                        'total cost': plp.value(model.objective)})
+
+    results = pd.DataFrame(results).round(3)
+
+    assert results['total cost'].nunique() == 1, \
+    'Presolve changed the total cost:\n{}'.format(results[['model', 'status', 'total cost']])
+
+    print("-------------------------")
+    print("Cities x dates =", no_cities, "x", no_days)
+    print("Dropped rows\n{}".format(report.to_string(index = False)))
+    print(results.to_string(index = False))
+    print("Solve speedup =", round(results['solve [s]'][0] / results['solve [s]'][1], 1))
+    print("-------------------------")
+
+    return results
+
+
+# No. of branch-and-bound nodes of a CBC log
+def cbc_nodes(log_filename):
+
+    with open(log_filename) as f:
+        for line in f:
+            if line.startswith('Enumerated nodes:'):
+                return int(line.split(':')[1])
+
+    return None
+
+
+# Compare the big-M and flow formulations: LP relaxation bound, branch-and-bound nodes and solve time of CBC
+# (both model the same trips, so they must reach the same total cost)
+def benchmark_formulations(no_cities = 8, no_days = 21, min_stay = 3, min_cities_to_visit = 3, log_filename = 'cbc.log'):
+
+    flights, hotels, home, start_date, end_date = synthetic_data(no_cities, no_days)
+
+    results = []
+
+    for formulation in FORMULATIONS:
+
+        builder = Model_Builder(flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit, formulation)
+        model = builder.build()
+
+        model.solve(plp.PULP_CBC_CMD(msg = False, mip = False))
+        relaxation = plp.value(model.objective)
+
+        if os.path.exists(log_filename):
+            os.remove(log_filename)
+
+        t = time()
+        model.solve(plp.PULP_CBC_CMD(msg = False, logPath = log_filename))
+        elapsed = time() - t
+
+        results.append({'formulation': formulation,
+                        'variables': len(builder.flight_keys) + len(builder.hotel_keys),
+                        'constraints': len(model.constraints),
+                        'LP bound': relaxation,
+                        'nodes': cbc_nodes(log_filename),
+                        'solve [s]': elapsed,
+                        'status': plp.LpStatus[model.status],
+                        'total cost': plp.value(model.objective)})
+
+    results = pd.DataFrame(results).round(3)
+
+    assert results['total cost'].nunique() == 1, \
+    'The formulations reach different total costs:\n{}'.format(results[['formulation', 'status', 'total cost']])
+
+    print("-------------------------")
+    print("Cities x dates =", no_cities, "x", no_days)
+    print(results.to_string(index = False))
+    print("-------------------------")
+
+    return results
+
+
+if __name__ == "__main__":
+
+    benchmark_build()
+    benchmark_objective()
+    benchmark_presolve()
+    benchmark_formulations()
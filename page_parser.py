@@ -0,0 +1,255 @@
+from lxml import etree, html
+
+import os
+import re
+from functools import partial
+from time import time
+
+
+# Xpath of the elements having all the given classes (the equivalent of the css selector tag.class1.class2)
+def css_xpath(tag, *classes):
+
+    conditions = ["contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(name) for name in classes]
+
+    return tag + ''.join('[' + condition + ']' for condition in conditions)
+
+
+# Xpaths of the results pages, compiled once (same elements as the ones the scrapers look up on the live browser)
+FLIGHT_XPATHS = {
+    # Shows up if there are no flights on that day (div.fss-fxo-legs)
+    'no_flights': etree.XPath('//' + css_xpath('div', 'fss-fxo-legs')),
+    # Best offer (automatically sorted), and its price
+    'offer': etree.XPath("//li[contains(@class, day-list-item.ItinerariesContainer)]//div//div//article"),
+    'price': etree.XPath("//a[contains(@class, 'CTASection__total-price')]"),
+    # Summary of the offer (shown once the offer has been clicked), with the operator, departure and arrival times
+    'operator': etree.XPath("//span[contains(@class, 'ItineraryLeg__operated-by')]"),
+    'times': etree.XPath("//div//div[contains(@class, 'ItineraryLeg__segment-times')]"),
+    # The following are relative to an offer of the results list (read from its ticket, without opening the offer)
+    'ticket_price': etree.XPath(".//a[contains(@class, 'CTASection__total-price')]"),
+    'ticket_operator': etree.XPath(".//div[contains(@class, 'LegLogo')]//img/@alt"),
+    'ticket_times': etree.XPath(".//span[contains(@class, 'LegInfo_routePartialTime')]"),
+    }
+
+HOTEL_XPATHS = {
+    # First result (already sorted)
+    'offer': etree.XPath("//li[@class='hotel-item item-order__list-item js_co_item']"),
+    # The following are relative to the offer
+    'name': etree.XPath('.//' + css_xpath('span', 'item-link', 'name__copytext')),
+    'stars': etree.XPath('.//' + css_xpath('div', 'stars-wrp') + '/' + css_xpath('span', 'icon-ic', 'star')),
+    'website': etree.XPath('.//' + css_xpath('em', 'item__deal-best-ota', 'block', 'fs-normal', 'cur-pointer--hover')),
+    'per_night': etree.XPath('.//' + css_xpath('em', 'item__per-night', 'fs-normal') + '/span'),
+    'best_price': etree.XPath('.//' + css_xpath('strong', 'item__best-price', 'price_min')),
+    }
+
+
+class Parse_Error(ValueError):
+    pass
+
+
+# Parse a page source to an element tree
+def parse(page_source):
+    return html.fromstring(page_source)
+
+
+# Visible text of an element (whitespace normalised, as WebElement.text)
+def text(elem):
+    return ' '.join(elem.text_content().split())
+
+
+# Text lines of an element (its non-empty text nodes, as WebElement.text.split('\n'))
+def lines(elem):
+    return [line.strip() for line in elem.itertext() if line.strip()]
+
+
+# First element matched by an xpath, raises Parse_Error if there's none
+def first(xpath, root, name):
+
+    elems = xpath(root)
+
+    if not elems:
+        raise Parse_Error('No ' + name + ' on the page')
+
+    return elems[0]
+
+
+# Flight price from its text (the first number delimited by word boundaries, i.e. space, period, comma)
+def flight_price(price_text):
+    return int(re.findall(r'\b\d+\b', price_text)[0])
+
+
+# Hotel price from its text: remove Euro sign, remove thousands separator, and convert to int
+def hotel_price(price_text):
+    return int(price_text.replace("€", "").replace(".", "").replace(",", ""))
+
+
+# Price of the best offer of a flight results page (None if there are no flights on that day)
+def parse_flight_results(page_source):
+
+    root = parse(page_source)
+
+    if FLIGHT_XPATHS['no_flights'](root):
+        return None
+
+    first(FLIGHT_XPATHS['offer'], root, 'offer')
+
+    return flight_price(text(first(FLIGHT_XPATHS['price'], root, 'price')))
+
+
+# Operator, departure and arrival time and price of the top_n offers of a flight results page, read from their tickets
+# (empty if there are no flights on that day)
+def parse_flight_offers(page_source, top_n):
+
+    root = parse(page_source)
+
+    if FLIGHT_XPATHS['no_flights'](root):
+        return []
+
+    offers = FLIGHT_XPATHS['offer'](root)[:top_n]
+
+    if not offers:
+        raise Parse_Error('No offer on the page')
+
+    rows = []
+
+    for offer in offers:
+
+        operator = first(FLIGHT_XPATHS['ticket_operator'], offer, 'operator')
+        times = [text(elem) for elem in FLIGHT_XPATHS['ticket_times'](offer)]
+
+        if len(times) < 2:
+            raise Parse_Error('No departure / arrival times on the ticket')
+
+        price = flight_price(text(first(FLIGHT_XPATHS['ticket_price'], offer, 'price')))
+
+        rows.append((str(operator), times[0], times[1], price))
+
+    return rows
+
+
+# Operator, departure and arrival time of a flight results page, with the summary of the best offer opened
+def parse_flight_summary(page_source):
+
+    root = parse(page_source)
+
+    operator = text(first(FLIGHT_XPATHS['operator'], root, 'operator'))
+    times = lines(first(FLIGHT_XPATHS['times'], root, 'segment times'))
+
+    if len(times) < 2:
+        raise Parse_Error('No departure / arrival times on the page')
+
+    return operator, times[0], times[1]
+
+
+# Hotel name, no. of stars, deal website and price of an offer of a hotel results page
+def hotel_offer(offer):
+
+    name = text(first(HOTEL_XPATHS['name'], offer, 'hotel name'))
+    stars = len(HOTEL_XPATHS['stars'](offer))
+    website = text(first(HOTEL_XPATHS['website'], offer, 'deal website'))
+
+    # One night stays show the price per night, more than one night stays the total price
+    per_night = HOTEL_XPATHS['per_night'](offer)
+
+    if per_night:
+        price = text(per_night[0])
+    else:
+        price = text(first(HOTEL_XPATHS['best_price'], offer, 'price'))
+
+    return name, stars, website, hotel_price(price)
+
+
+# Hotel name, no. of stars, deal website and price of the top_n offers of a hotel results page (already sorted)
+def parse_hotel_offers(page_source, top_n):
+
+    offers = HOTEL_XPATHS['offer'](parse(page_source))[:top_n]
+
+    if not offers:
+        raise Parse_Error('No offer on the page')
+
+    return [hotel_offer(offer) for offer in offers]
+
+
+# Hotel name, no. of stars, deal website and price of the best offer of a hotel results page
+def parse_hotel_results(page_source):
+    return parse_hotel_offers(page_source, 1)[0]
+
+
+# Save a page source as <directory>/<name>-<no>.html, to be used as a fixture of the parsers
+def save_page(directory, name, page_source):
+
+    os.makedirs(directory, exist_ok = True)
+
+    no = len([f for f in os.listdir(directory) if f.startswith(name + '-')])
+    filename = os.path.join(directory, '{}-{}.html'.format(name, no))
+
+    with open(filename, 'w', encoding = 'utf-8') as f:
+        f.write(page_source)
+
+    return filename
+
+
+# Saved pages and the values their parser should return
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+FIXTURES = [('flight_results.html', parse_flight_results, 87),
+            ('flight_no_results.html', parse_flight_results, None),
+            ('flight_summary.html', parse_flight_summary, ('Ryanair', '06:25', '08:30')),
+            ('flight_results.html', partial(parse_flight_offers, top_n = 5),
+             [('Ryanair', '06:25', '08:30', 87), ('Wizz Air', '17:40', '19:35', 112)]),
+            ('flight_no_results.html', partial(parse_flight_offers, top_n = 5), []),
+            ('hotel_one_night.html', parse_hotel_results, ('Hotel Piast Wroclaw', 3, 'Booking.com', 64)),
+            ('hotel_many_nights.html', parse_hotel_results, ('Art Hotel', 4, 'Expedia', 1234)),
+            ('hotel_one_night.html', partial(parse_hotel_offers, top_n = 5),
+             [('Hotel Piast Wroclaw', 3, 'Booking.com', 64), ('Hostel Mleczarnia', 1, 'Hostelworld', 71)])]
+
+
+# Saved page of the fixtures
+def read_fixture(filename, path = FIXTURES_PATH):
+
+    with open(os.path.join(path, filename), encoding = 'utf-8') as f:
+        return f.read()
+
+
+# Check the parsers against the saved pages (e.g. after changing an xpath), raises AssertionError listing the ones that
+# parsed something else or failed
+def check_fixtures(fixtures = FIXTURES, path = FIXTURES_PATH):
+
+    failures = []
+
+    for filename, parser, expected in fixtures:
+
+        try:
+            result = parser(read_fixture(filename, path))
+        except Parse_Error as e:
+            result = e
+
+        if result != expected:
+            failures.append('{}: parsed {!r}, expected {!r}'.format(filename, result, expected))
+
+    if failures:
+        raise AssertionError('\n'.join(failures))
+
+    return len(fixtures)
+
+
+# Time the parsers on the saved pages (pages per second)
+def benchmark(fixtures = FIXTURES, path = FIXTURES_PATH, repeat = 2000):
+
+    for filename, parser, _ in fixtures:
+
+        page_source = read_fixture(filename, path)
+
+        t = time()
+
+        for _ in range(repeat):
+            result = parser(page_source)
+
+        print('{}: {} -> {:.0f} pages/s'.format(filename, result, repeat / (time() - t)))
+
+    return
+
+
+if __name__ == "__main__":
+
+    print('Fixtures checked:', check_fixtures())
+    benchmark()
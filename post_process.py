@@ -3,26 +3,56 @@
 # Missing from hotels Bohinj: 01/07/2019 - 01/08-2019 - No hotels avaialable
 
 import pandas as pd
+from multiprocessing import Pool
+from time import time
 
-def hf_to_csv(hf_filename, csv_filename):
-    
-    with pd.HDFStore(hf_filename) as hdf:
-            keys = hdf.keys()
-    
-    dfs = []
-    
-    for key in keys:
-        df = pd.read_hdf(hf_filename, key = key)
-        dfs.append(df)
-        
-    df = pd.concat(dfs, ignore_index = True)
-    
-    df.to_csv(csv_filename, index = False, sep = '\t')
-    
-    return
+def hf_to_csv(hf_filename, csv_filename, chunksize = 100000):
+
+    t = time()
+    no_rows = 0
+    header = True
+
+    # Keep the store open, and write each key's rows to the output as they are read
+    with pd.HDFStore(hf_filename, mode = 'r') as hdf, open(csv_filename, 'w') as f:
+
+        # Union of the columns of all the keys (as pd.concat would), in order of appearance, read without the rows
+        columns = []
+
+        for key in hdf.keys():
+            columns += [column for column in hdf.select(key, start = 0, stop = 0).columns if column not in columns]
+
+        for key in hdf.keys():
+
+            # Table-format keys can be read in chunks, fixed-format ones only as a whole
+            if hdf.get_storer(key).is_table:
+                chunks = hdf.select(key, chunksize = chunksize)
+            else:
+                chunks = [hdf.select(key)]
+
+            for df in chunks:
+
+                # Align the columns with the union (missing ones are left empty), header goes with the first chunk
+                df.reindex(columns = columns).to_csv(f, index = False, sep = '\t', header = header)
+                header = False
+                no_rows += len(df)
+
+    elapsed = time() - t
+
+    print('{} -> {}: {} rows in {:.2f} s ({:.0f} rows/s)'.format(hf_filename, csv_filename, no_rows, elapsed, no_rows / elapsed))
+
+    return no_rows
+
+
+# Convert a number of stores in parallel
+def hf_to_csv_parallel(filename_pairs, no_processes = None):
+
+    with Pool(no_processes) as p:
+        no_rows = p.starmap(hf_to_csv, filename_pairs)
+
+    return no_rows
 
 
 if __name__ == "__main__":
-    
-    hf_to_csv('hotel_data.h5', 'hotels.csv')
-    hf_to_csv('flight_data.h5', 'flights.csv')
\ No newline at end of file
+
+    hf_to_csv_parallel([('hotel_data.h5', 'hotels.csv'),
+                        ('flight_data.h5', 'flights.csv')])
@@ -0,0 +1,129 @@
+import pandas as pd
+import numpy as np
+
+import os
+import json
+from datetime import datetime as dt
+from datetime import timedelta
+
+from constants import DATE_FORMAT, NO_FLIGHT_PRICE
+
+
+class Price_Tensors(object):
+
+    # Initialize
+    def __init__(self, cities, dates, flights, hotels):
+
+        self.cities = list(cities)   # City codes -> names
+        self.dates = list(dates)     # Day codes -> dates (consecutive days)
+        self.flights = flights       # float32 [city_from, city_to, day], inf = no flight
+        self.hotels = hotels         # float32 [city, check_in_day, check_out_day], inf = no offer
+
+        self.city_codes = {city: idx for idx, city in enumerate(self.cities)}
+        self.date_codes = {date: idx for idx, date in enumerate(self.dates)}
+
+
+    # Convert the scraped flight and hotel frames to dense price arrays (cheapest offer if there are duplicates)
+    @classmethod
+    def from_frames(cls, flights, hotels, cities = None, dates = None, date_format = DATE_FORMAT):
+
+        if cities is None:
+            cities = sorted(set(flights['city_from']) | set(flights['city_to']) | set(hotels['city']))
+
+        if dates is None:
+            parsed = pd.to_datetime(pd.concat([flights['date'], hotels['check_in'], hotels['check_out']]),
+                                    format = date_format)
+            no_days = (parsed.max() - parsed.min()).days + 1
+            dates = [dt.strftime(parsed.min() + timedelta(n), date_format) for n in range(no_days)]
+
+        tensors = cls(cities, dates,
+                      np.full((len(cities), len(cities), len(dates)), np.inf, dtype = np.float32),
+                      np.full((len(cities), len(dates), len(dates)), np.inf, dtype = np.float32))
+
+        city_codes, date_codes = tensors.city_codes, tensors.date_codes
+
+        # Drop the offers outside the given cities / dates and the 'no flight' placeholders
+        flights = flights[flights['city_from'].isin(city_codes) & flights['city_to'].isin(city_codes) & \
+                          flights['date'].isin(date_codes) & (flights['price'] < NO_FLIGHT_PRICE)]
+
+        hotels = hotels[hotels['city'].isin(city_codes) & \
+                        hotels['check_in'].isin(date_codes) & hotels['check_out'].isin(date_codes)]
+
+        np.minimum.at(tensors.flights,
+                      (flights['city_from'].map(city_codes).to_numpy(),
+                       flights['city_to'].map(city_codes).to_numpy(),
+                       flights['date'].map(date_codes).to_numpy()),
+                      flights['price'].to_numpy(dtype = np.float32))
+
+        np.minimum.at(tensors.hotels,
+                      (hotels['city'].map(city_codes).to_numpy(),
+                       hotels['check_in'].map(date_codes).to_numpy(),
+                       hotels['check_out'].map(date_codes).to_numpy()),
+                      hotels['price'].to_numpy(dtype = np.float32))
+
+        return tensors
+
+
+    # Prices of the given cities (all if None), from start_date up to end_date (the first / last date if None)
+    def select(self, cities = None, start_date = None, end_date = None):
+
+        city_idx = np.arange(len(self.cities)) if cities is None else np.array([self.city_codes[city] for city in cities])
+
+        start_idx = 0 if start_date is None else self.date_codes[start_date]
+        end_idx = len(self.dates) - 1 if end_date is None else self.date_codes[end_date]
+        day_idx = np.arange(start_idx, end_idx + 1)
+
+        return Price_Tensors([self.cities[idx] for idx in city_idx],
+                             self.dates[start_idx: end_idx + 1],
+                             self.flights[np.ix_(city_idx, city_idx, day_idx)],
+                             self.hotels[np.ix_(city_idx, day_idx, day_idx)])
+
+
+    # Total price of the flight (city_from, city_to, date) and hotel (city, check_in, check_out) keys of an itinerary
+    def cost(self, flight_keys, hotel_keys):
+
+        city, date = self.city_codes, self.date_codes
+
+        return float(sum(self.flights[city[a], city[b], date[d]] for a, b, d in flight_keys) + \
+                     sum(self.hotels[city[c], date[i], date[j]] for c, i, j in hotel_keys))
+
+
+    # Save the arrays as .npy files (and the city / date codes as json) in a directory
+    def save(self, dirname):
+
+        os.makedirs(dirname, exist_ok = True)
+
+        np.save(os.path.join(dirname, 'flights.npy'), self.flights)
+        np.save(os.path.join(dirname, 'hotels.npy'), self.hotels)
+
+        with open(os.path.join(dirname, 'codes.json'), 'w') as f:
+            json.dump({'cities': self.cities, 'dates': self.dates}, f)
+
+        return
+
+
+    # Load the arrays saved with save(), memory-mapped by default
+    @classmethod
+    def load(cls, dirname, mmap_mode = 'r'):
+
+        with open(os.path.join(dirname, 'codes.json')) as f:
+            codes = json.load(f)
+
+        flights = np.load(os.path.join(dirname, 'flights.npy'), mmap_mode = mmap_mode)
+        hotels = np.load(os.path.join(dirname, 'hotels.npy'), mmap_mode = mmap_mode)
+
+        return cls(codes['cities'], codes['dates'], flights, hotels)
+
+
+if __name__ == "__main__":
+
+    from columnar_store import read_scraped
+
+    # Convert the scraped data (optimizer input format) and save it for the downstream solvers
+    flights, hotels = read_scraped('scraped.parquet')
+
+    tensors = Price_Tensors.from_frames(flights, hotels)
+    tensors.save('prices')
+
+    print("Cities =", len(tensors.cities), "| Days =", len(tensors.dates))
+    print("Flight offers =", np.isfinite(tensors.flights).sum(), "| Hotel offers =", np.isfinite(tensors.hotels).sum())
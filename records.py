@@ -0,0 +1,15 @@
+import pandas as pd
+
+from collections import namedtuple
+
+
+# One offer of a query, as emitted by the scrapers (tuples are cheap to build and to pickle across the result queue)
+Flight_Record = namedtuple('Flight_Record', ['city_from', 'city_to', 'date', 'flight', 'departure', 'arrival', 'price', 'rank'])
+Hotel_Record = namedtuple('Hotel_Record', ['city', 'check_in', 'check_out', 'hotel', 'stars', 'offered_by', 'price', 'rank'])
+
+RECORDS = {'flight': Flight_Record, 'hotel': Hotel_Record}
+
+
+# Materialize a batch of records into a frame, in one go
+def to_frame(records, scrape_type):
+    return pd.DataFrame.from_records(records, columns = RECORDS[scrape_type]._fields)
@@ -0,0 +1,146 @@
+import pandas as pd
+import numpy as np
+
+import pulp as plp
+from multiprocessing import Pool, cpu_count
+from itertools import product
+from time import time
+
+from price_tensors import Price_Tensors
+from trip_graph import Trip_Graph, Graph_Model_Builder
+
+
+# Price tensors of the current pool process (see init_worker)
+tensors = None
+
+# Settings of a scenario, unless given:
+# - cities: the ones to choose from (including home), all of them if None
+# - start_date / end_date: the first / last date of the tensors if None
+# - engine: 'graph' (PuLP / CBC on the trip graph) or 'dp' (exact, up to 15 destinations)
+# - time_limit: seconds CBC may take (the best trip found by then is reported), the DP engine always runs to completion
+DEFAULT_SCENARIO = {'cities': None, 'start_date': None, 'end_date': None, 'engine': 'graph', 'time_limit': 60}
+
+
+# All the combinations of the given settings (lists of values), e.g. scenario_grid(home = ['Amsterdam'], min_stay = [3, 4])
+# Each scenario needs home, min_stay and min_cities_to_visit, the rest defaults to DEFAULT_SCENARIO
+def scenario_grid(**options):
+
+    names = list(options)
+
+    return [dict(DEFAULT_SCENARIO, **dict(zip(names, values))) for values in product(*options.values())]
+
+
+# Pool process initializer: load the tensors memory-mapped, so that all the processes share their pages
+def init_worker(dirname):
+
+    global tensors
+    tensors = Price_Tensors.load(dirname)
+
+    return
+
+
+# Cheapest trip of a scenario on the tensors of the process
+# Returns the scenario with its status, cost, itinerary, no. of cities visited, lower bound and solve time
+def solve_scenario(scenario):
+
+    scenario = dict(DEFAULT_SCENARIO, **scenario)
+
+    t = time()
+    itinerary, bound = None, None
+
+    try:
+        prices = tensors.select(scenario['cities'], scenario['start_date'], scenario['end_date'])
+
+        graph = Trip_Graph(prices, scenario['home'], prices.dates[0], prices.dates[-1], scenario['min_stay'],
+                           scenario['min_cities_to_visit'])
+
+        bound = graph.relaxation_bound()
+
+        if scenario['engine'] == 'graph':
+
+            builder = Graph_Model_Builder(graph)
+            model = builder.build()
+            model.solve(plp.PULP_CBC_CMD(msg = False, timeLimit = scenario['time_limit']))
+
+            status = plp.LpSolution[model.sol_status]
+
+            if model.sol_status in (plp.LpSolutionOptimal, plp.LpSolutionIntegerFeasible):
+                itinerary = builder.solution()
+
+        elif scenario['engine'] == 'dp':
+
+            itinerary = graph.solve_dp()
+            status = 'Optimal Solution Found' if itinerary is not None else 'Infeasible'
+
+        else:
+            raise ValueError('Invalid engine')
+
+    except Exception as e:
+        status = repr(e)
+
+    result = dict(scenario,
+                  cities = 'all' if scenario['cities'] is None else ', '.join(scenario['cities']),
+                  status = status,
+                  cost = prices.cost(*itinerary) if itinerary is not None else np.nan,
+                  itinerary = ' -> '.join('{} ({} - {})'.format(*key) for key in itinerary[1]) if itinerary is not None else '',
+                  no_cities = len(itinerary[1]) if itinerary is not None else 0,
+                  bound = bound,
+                  solve_time = time() - t)
+
+    return result
+
+
+# Solve the scenarios over a pool of no_processes processes, on the price tensors saved in dirname (see Price_Tensors.save)
+# Returns a table with the settings and results of each scenario (written to filename as csv, if given)
+def sweep(dirname, scenarios, no_processes = None, filename = None):
+
+    no_processes = no_processes if no_processes is not None else cpu_count() - 1
+
+    t = time()
+    results = []
+
+    with Pool(max(no_processes, 1), initializer = init_worker, initargs = (dirname, )) as p:
+
+        for result in p.imap(solve_scenario, scenarios):
+
+            results.append(result)
+
+            print('Scenario {} / {}: {} | cost = {} | {:.2f} s'.format(
+                len(results), len(scenarios), result['status'], result['cost'], result['solve_time']))
+
+    columns = ['home', 'min_stay', 'min_cities_to_visit', 'cities', 'start_date', 'end_date', 'engine', 'time_limit', 'status',
+               'cost', 'bound', 'no_cities', 'itinerary', 'solve_time']
+
+    results = pd.DataFrame(results)
+    results = results[columns + [column for column in results.columns if column not in columns]]
+
+    if filename is not None:
+        results.to_csv(filename, index = False)
+
+    print('{} scenarios in {:.2f} s'.format(len(scenarios), time() - t))
+
+    return results
+
+
+if __name__ == "__main__":
+
+    from columnar_store import read_scraped
+    from stay_estimator import estimate_stays
+
+    # Load and index the scraped data once, for all the scenarios (stays longer than the hotel scraper's max_stay estimated)
+    flights, hotels = read_scraped('scraped.parquet')
+    Price_Tensors.from_frames(flights, estimate_stays(hotels, max_stay = 7)).save('prices')
+
+    active_cities = ['Amsterdam', 'Wroclaw', 'Hvar', 'Riga', 'Milan', 'Athens', 'Budapest', 'Lisbon', 'Bohinj', 'Bilbao', 'Colmar']
+
+    scenarios = scenario_grid(home = ['Amsterdam'],
+                              min_stay = [3, 4, 5],
+                              min_cities_to_visit = [5, 6, 7],
+                              cities = [active_cities, active_cities[0:7]],
+                              start_date = ['07/01/2019'],
+                              end_date = ['08/01/2019', '07/15/2019'],
+                              time_limit = [300])
+
+    results = sweep('prices', scenarios, filename = 'sweep.csv')
+
+    print(results.drop(columns = ['itinerary']).to_string(index = False))
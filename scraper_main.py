@@ -1,29 +1,363 @@
 from hotel_scraper import Hotel_Scraper
 from flight_scraper import Flight_Scraper
+from job_ledger import Job_Ledger
+from columnar_store import Columnar_Store
+from concurrency import Concurrency_Controller
+from records import to_frame
+from waits import Wait_Strategy
 
-from time import sleep
+from time import time, sleep
 from tbselenium.utils import start_xvfb, stop_xvfb # pip install Xvfb
 
-from multiprocessing import Pool, cpu_count, Manager
+from multiprocessing import Pool, Queue, Value, cpu_count, current_process
+from multiprocessing.util import Finalize
+from queue import Empty
+from threading import Thread, Lock
 from datetime import datetime as dt
 from datetime import timedelta
 from itertools import product
+from collections import defaultdict, deque
+import heapq
+import random
 
-import pandas as pd
-from functools import partial
+import os
+
+
+# Browser session of the current pool process (see Scraper.init_session)
+session = None
+
+# Queue the pool processes put their results to (see Scraper.init_worker)
+results = None
+
+
+class Result_Sink(object):
+    
+    # Open the output once, results (the records of a query, see records.py) are buffered and written in batches of
+    # flush_every queries
+    # A filename ending in .parquet is a columnar store (see Columnar_Store), anything else a headerless csv file
+    # Queries are marked as completed on the ledger (if given) only once they are on disk
+    def __init__(self, filename, scrape_type, flush_every = 100, ledger = None):
+        
+        self.scrape_type = scrape_type
+        
+        if filename.endswith('.parquet'):
+            self.store = Columnar_Store(filename, scrape_type)
+            self.file = None
+        else:
+            self.store = None
+            self.file = open(filename, 'a')
+        
+        self.flush_every = flush_every
+        self.ledger = ledger
+        self.buffer = []
+        self.buffered_results = 0
+        self.buffered_queries = []
+        
+        self.no_results = 0
+        self.no_rows = 0
+    
+    
+    # Buffer a result, and write the buffer if it is full
+    def write(self, records, queries = ()):
+        
+        self.buffer.extend(records)
+        self.buffered_results += 1
+        self.buffered_queries.extend(queries)
+        self.no_results += 1
+        
+        if self.buffered_results >= self.flush_every:
+            self.flush()
+        
+        return
+    
+    
+    # Write the buffered results to disk
+    def flush(self):
+        
+        if self.buffered_results:
+            
+            # Materialize the frame in bulk
+            df = to_frame(self.buffer, self.scrape_type)
+            
+            if self.store is not None:
+                self.store.append(df)
+            else:
+                df.to_csv(self.file, header = False, index = False)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            
+            if self.ledger is not None:
+                self.ledger.mark(self.buffered_queries, 'completed')
+            
+            self.no_rows += len(df)
+            self.buffer = []
+            self.buffered_results = 0
+            self.buffered_queries = []
+        
+        return
+    
+    
+    def close(self):
+        
+        self.flush()
+        
+        if self.file is not None:
+            self.file.close()
+        
+        return
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *args):
+        self.close()
+
+
+class Retry_Policy(object):
+    
+    # Retry a failed job until its queries have been dispatched max_attempts times (over all runs), after an exponential
+    # backoff with full jitter (up to base_delay * 2 ^ (attempts - 1), capped at max_delay seconds)
+    # Jobs that run out of attempts are quarantined: reruns skip them, unless released from quarantine
+    def __init__(self, max_attempts = 3, base_delay = 30, max_delay = 600):
+        
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    
+    def should_retry(self, attempts):
+        return attempts < self.max_attempts
+    
+    
+    # Seconds to wait before the next attempt
+    def delay(self, attempts):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+
+class Scraper_Session(object):
+    
+    # Keep a virtual display (if required) and a browser alive between the jobs of the pool process
+    # If live_browsers and browser_limit are given (shared counters of all the pool processes, see Scraper.run), the browser
+    # and display of an idle process are closed while more browsers are live than the limit (checked every idle_check
+    # seconds), so that the limit on the jobs running at once bounds the browsers kept alive as well
+    def __init__(self, scrape_type, recycle_after, scraper_options = None, virtual_display = True, live_browsers = None,
+                 browser_limit = None, idle_check = 5):
+        
+        self.scrape_type = scrape_type
+        self.recycle_after = recycle_after # Restart the browser after this many jobs
+        self.scraper_options = scraper_options if scraper_options is not None else {} # Keyword arguments of the scrapers
+        
+        self.virtual_display = virtual_display
+        self.xvfb_display = None
+        self.scraper = None
+        
+        self.live_browsers = live_browsers
+        self.browser_limit = browser_limit
+        self.lock = Lock() # Held while running a job
+        
+        # Metrics
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.browser_starts = 0
+        self.jobs_since_start = 0
+        self.t_start = time()
+        self.timings = defaultdict(list) # Step -> durations, over all the browsers of the session
+        self.job_timings = defaultdict(list) # Step -> durations, since the last job reported back
+        
+        # Close the browser and display when the pool process exits
+        Finalize(self, self.close, exitpriority = 10)
+        
+        if live_browsers is not None and browser_limit is not None:
+            Thread(target = self.watch, args = (idle_check, ), daemon = True).start()
+    
+    
+    # Return a warmed-up scraper, (re)starting the browser if needed
+    def get_scraper(self, no_adults):
+        
+        if self.scraper is not None and (self.jobs_since_start >= self.recycle_after or self.scraper.no_adults != no_adults):
+            self.discard()
+        
+        if self.scraper is None:
+            
+            if self.virtual_display and self.xvfb_display is None:
+                self.xvfb_display = start_xvfb()
+            
+            if self.scrape_type == 'hotel':
+                self.scraper = Hotel_Scraper(**self.scraper_options)
+            else:
+                self.scraper = Flight_Scraper(**self.scraper_options)
+            
+            self.scraper.start(no_adults)
+            self.browser_starts += 1
+            self.jobs_since_start = 0
+            
+            if self.live_browsers is not None:
+                with self.live_browsers.get_lock():
+                    self.live_browsers.value += 1
+        
+        return self.scraper
+    
+    
+    # Run a job on the warmed-up browser, yielding the records of each query as soon as it is done
+    # The browser is thrown away on failure
+    def run(self, args):
+        
+        with self.lock:
+            
+            try:
+                for records in self.get_scraper(args["no_adults"]).iter_search(args):
+                    yield records
+            except:
+                self.jobs_failed += 1
+                self.discard()
+                raise
+            
+            self.jobs_done += 1
+            self.jobs_since_start += 1
+        
+        return
+    
+    
+    # Close the browser
+    def discard(self):
+        
+        if self.scraper is not None:
+            try:
+                self.scraper.stop()
+            except:
+                pass # The browser may have already crashed
+            
+            self.collect_timings()
+            
+            if self.live_browsers is not None:
+                with self.live_browsers.get_lock():
+                    self.live_browsers.value -= 1
+        
+        self.scraper = None
+        
+        return
+    
+    
+    # Close the browser and the virtual display if the process is idle, and more browsers are live than the limit
+    def release_if_over_limit(self):
+        
+        if not self.lock.acquire(blocking = False):
+            return # Running a job
+        
+        try:
+            # Decided under the lock of the counter, so that no two processes close their browsers for the same excess one
+            with self.live_browsers.get_lock():
+                if self.scraper is not None and self.live_browsers.value > self.browser_limit.value:
+                    self.discard()
+                    
+                    if self.xvfb_display is not None:
+                        stop_xvfb(self.xvfb_display)
+                        self.xvfb_display = None
+        finally:
+            self.lock.release()
+        
+        return
+    
+    
+    # Watch for idle browsers over the limit, for the lifetime of the pool process
+    def watch(self, idle_check):
+        
+        while True:
+            sleep(idle_check)
+            self.release_if_over_limit()
+    
+    
+    # Move the step timings of the current browser to the ones of the session (and of the running job)
+    def collect_timings(self):
+        
+        for step, durations in self.scraper.waits.timings.items():
+            self.timings[step].extend(durations)
+            self.job_timings[step].extend(durations)
+        
+        self.scraper.waits.timings.clear()
+        
+        return
+    
+    
+    # Step timings since the last call (i.e. of the last job, including starting the browser it ran on)
+    def pop_timings(self):
+        
+        if self.scraper is not None:
+            self.collect_timings()
+        
+        timings, self.job_timings = self.job_timings, defaultdict(list)
+        
+        return timings
+    
+    
+    # Close the browser and the virtual display, and report the metrics
+    def close(self):
+        
+        with self.lock:
+            self.discard()
+            
+            if self.xvfb_display is not None:
+                stop_xvfb(self.xvfb_display)
+                self.xvfb_display = None
+        
+        minutes = (time() - self.t_start) / 60
+        
+        print('{}: {} jobs done, {} failed, {} browser starts, {:.2f} jobs/minute'.format(
+            current_process().name, self.jobs_done, self.jobs_failed, self.browser_starts, self.jobs_done / minutes))
+        
+        # Where the time went
+        if self.timings:
+            print('{}: time per step\n{}'.format(current_process().name, Wait_Strategy.report(self.timings).to_string(index = False)))
+        
+        return
 
 
 class Scraper(object):
     
     # Initialize
-    def __init__(self, filename, scrape_type, max_job, no_processes, queries_per_process = 1):
+    def __init__(self, filename, scrape_type, no_processes, queries_per_process = 1, persistent = True, recycle_after = 50,
+                 ledger_filename = None, parse_pages = False, top_n = 1, scraper_options = None, virtual_display = True,
+                 adaptive = False, controller_options = None, retry_policy = None, min_stay = 1, max_stay = None,
+                 query_timeout = 600):
         
         self.scrape_type = scrape_type
-        self.max_job = max_job 
         self.no_processes = no_processes 
         self.queries_per_process = queries_per_process
         self.filename = filename
         
+        # Ledger of the completed / failed / in-flight queries, used to resume after a crash
+        self.ledger_filename = ledger_filename if ledger_filename is not None else filename + '.jobs.db'
+        
+        # Keep one display and browser alive per pool process (recycled after recycle_after jobs or on failure)
+        self.persistent = persistent
+        self.recycle_after = recycle_after
+        
+        # Keyword arguments of the hotel / flight scrapers (i.e. the url and browser of the stand-in site, see stand_in.py):
+        # Parse the results from the page sources in-process (see page_parser) instead of reading each element from the browser
+        # Keep the top_n offers of each query (one row per offer, ranked as sorted by the website)
+        self.scraper_options = dict(scraper_options or {}, parse_pages = parse_pages, top_n = top_n)
+        
+        # Run the browsers on a virtual display (not needed by headless browsers)
+        self.virtual_display = virtual_display
+        
+        # Adapt the no. of jobs running at once (up to no_processes) to the observed latency, memory and captcha / error rates
+        # (keyword arguments of Concurrency_Controller in controller_options)
+        self.adaptive = adaptive
+        self.controller_options = controller_options if controller_options is not None else {}
+        
+        # Retry failed jobs with backoff, quarantine the ones that keep failing
+        self.retry_policy = retry_policy if retry_policy is not None else Retry_Policy()
+        
+        # A running job that has not reported for query_timeout seconds (i.e. its pool process died) is given up as lost
+        self.query_timeout = query_timeout
+        
+        # Hotels: only query the stays of min_stay up to max_stay nights (all of them if None), the longer ones are estimated
+        # from the scraped ones (see stay_estimator)
+        self.min_stay = min_stay
+        self.max_stay = max_stay
+        
         # Input check
         if self.scrape_type not in ['hotel', 'flight']:
             raise ValueError('Invalid scraper type')
@@ -32,9 +366,28 @@ class Scraper(object):
         self.date_format = "%d/%m/%Y"
 
 
+    # Split the queries of a route / destination into (near) equally sized batches of at most batch_size queries
+    @staticmethod
+    def batches(queries, batch_size):
+        
+        no_batches = -(-len(queries) // batch_size)
+        
+        if not no_batches:
+            return []
+        
+        # The first (len % no_batches) batches get one query more than the others
+        size, extra = divmod(len(queries), no_batches)
+        bounds = [idx * size + min(idx, extra) for idx in range(no_batches + 1)]
+        
+        return [queries[start: end] for start, end in zip(bounds[:-1], bounds[1:])]
+    
+    
     # Return a list of equal query-sized inputs for the flight scraper processes
+    # Each job covers one route and a batch of departure dates, so that the route is entered once per batch
+    # Queries whose hash is in completed are skipped, only the ones in only are kept (if given)
     @staticmethod
-    def flight_scraper_input_list(destinations, start_date, end_date, no_adults, date_format):
+    def flight_scraper_input_list(destinations, start_date, end_date, no_adults, date_format, batch_size = 1, completed = frozenset(),
+                                  only = None):
         
         # Parse starting and ending dates for the trip
         tStart = dt.strptime(start_date, date_format) 
@@ -58,26 +411,35 @@ class Scraper(object):
         # Generate list of dicts containing the inputs for each process
         flight_scraper_inputs = []
         
-        for idx, elem in enumerate(product(city_pairs, dates)):
+        for city_from, city_to in city_pairs:
             
-            city_from = elem[0][0]
-            city_to = elem[0][1]
-            departure_dates = list(elem[1])
+            # Remaining dates for this route
+            queries = [(date, Job_Ledger.hash(('flight', city_from, city_to, date, no_adults))) for date in dates]
+            queries = [query for query in queries if query[1] not in completed and (only is None or query[1] in only)]
             
-            inputs = {"no_adults" : no_adults,
-                      "city_from" : [city_from],
-                      "city_to" : [city_to],
-                      "departure_dates" : departure_dates,
-                      "id" : idx}
+            for batch in Scraper.batches(queries, batch_size):
+                
+                hashes = [job_hash for _, job_hash in batch]
             
-            flight_scraper_inputs.append(inputs)
+                inputs = {"no_adults" : no_adults,
+                          "city_from" : [city_from],
+                          "city_to" : [city_to],
+                          "departure_dates" : [date for date, _ in batch],
+                          "queries" : hashes,
+                          "id" : Job_Ledger.hash(hashes)}
+                
+                flight_scraper_inputs.append(inputs)
             
         return flight_scraper_inputs
         
     
     # Return a list of inputs for the hotel scraper processes
+    # Each job covers one destination and a batch of date pairs, so that the destination is entered once per batch
+    # Only the stays of min_stay up to max_stay nights are queried (all of them if max_stay is None)
+    # Queries whose hash is in completed are skipped, only the ones in only are kept (if given)
     @staticmethod
-    def hotel_scraper_input_list(destinations, start_date, end_date, no_adults, date_format):
+    def hotel_scraper_input_list(destinations, start_date, end_date, no_adults, date_format, batch_size = 1, completed = frozenset(),
+                                 only = None, min_stay = 1, max_stay = None):
         
         # Parse starting and ending dates for the trip
         tStart = dt.strptime(start_date, date_format) 
@@ -92,7 +454,8 @@ class Scraper(object):
         for tStart_outer in (tStart + timedelta(n) for n in tRange_outer):
                 
             # Derive a day range to loop from for the end date
-            tRange_inner = range(1, (tEnd - tStart_outer).days + 1)
+            max_nights = (tEnd - tStart_outer).days if max_stay is None else min(max_stay, (tEnd - tStart_outer).days)
+            tRange_inner = range(min_stay, max_nights + 1)
                 
             for date in (tStart_outer + timedelta(n) for n in tRange_inner):
                 tCursor_end = dt.strftime(date, date_format)
@@ -103,41 +466,37 @@ class Scraper(object):
         # Iterate over each destination and each date-pair to create a dataframe
         inputs = [] # Empty list to hold the results
         
-        for idx, (destination, date_pair) in enumerate(product(destinations, date_pairs)):
+        for destination in destinations:
+            
+            # Remaining date pairs for this destination
+            queries = [(date_pair, Job_Ledger.hash(('hotel', destination) + date_pair + (no_adults, ))) for date_pair in date_pairs]
+            queries = [query for query in queries if query[1] not in completed and (only is None or query[1] in only)]
             
-            # Generate a dictionary with the destination included, and a unique set of start dates
-            temp = date_pair.to_dict('list')
-            temp["no_adults"] = no_adults
-            temp['destinations'] = [destination]
-            temp["id"] = idx
+            for batch in Scraper.batches(queries, batch_size):
+                
+                hashes = [job_hash for _, job_hash in batch]
             
-            # Append to list
-            inputs.append(temp)
+                # Generate a dictionary with the destination included, and a unique set of start dates
+                temp = {"start_dates" : [check_in for (check_in, _), _ in batch],
+                        "end_dates" : [check_out for (_, check_out), _ in batch]}
+                temp["no_adults"] = no_adults
+                temp['destinations'] = [destination]
+                temp["queries"] = hashes
+                temp["id"] = Job_Ledger.hash(hashes)
+                
+                # Append to list
+                inputs.append(temp)
         
         return inputs
     
         
-    # Generate a list of remaining jobIDs to run
-    def get_remaining_jobs(self):
-        
-        # Get all the keys from the file
-        with pd.HDFStore(self.filename) as hdf:
-            keys = hdf.keys()
+    # Generate a list of dicts for the flight and hotel scraper, for the queries that are not completed (or quarantined) yet
+    # Only the failed queries are kept if only_failed
+    def generate_inputs(self, destinations, start_date, end_date, no_adults, ledger, only_failed = False):
         
-        # Get the job id from each key
-        finished_jobs =[elem.replace('/', '') for elem in keys]
-        
-        # Construct job id for all the jobs we want to perform
-        all_jobs = ['job_' + str(elem) for elem in range(self.max_job + 1)]
-        
-        # Get the job IDs that need to be performed
-        remaining_jobs = list(set(all_jobs) - set(finished_jobs))
-        
-        return remaining_jobs
-    
-    
-    # Generate a list of dicts for the flight and hotel scraper    
-    def generate_inputs(self, destinations, start_date, end_date, no_adults):
+        completed = ledger.completed()
+        quarantined = ledger.with_status('quarantined')
+        only = ledger.with_status('failed') if only_failed else None
         
         # Scraping hotels
         if self.scrape_type == 'hotel':
@@ -145,119 +504,338 @@ class Scraper(object):
                                                            start_date, 
                                                            end_date,
                                                            no_adults,
-                                                           self.date_format)
+                                                           self.date_format,
+                                                           self.queries_per_process,
+                                                           completed | quarantined,
+                                                           only,
+                                                           self.min_stay,
+                                                           self.max_stay)
         # Scraping flights
         else:
             scraper_inputs = self.flight_scraper_input_list(destinations, 
                                                             start_date, 
                                                             end_date, 
                                                             no_adults,
-                                                            self.date_format)
-        
+                                                            self.date_format,
+                                                            self.queries_per_process,
+                                                            completed | quarantined,
+                                                            only)
+        
+        print('Completed queries: ', len(completed))
+        print('Quarantined queries: ', len(quarantined))
+        print('Remaining queries: ', sum(len(inputs["queries"]) for inputs in scraper_inputs))
         print('Total number of jobs: ', len(scraper_inputs))
         
-        # Get the appropriate inputs
-        remaining_jobs = self.get_remaining_jobs()
-        scraper_inputs = [(idx, inputs) for (idx, inputs) in scraper_inputs if idx in remaining_jobs]
+        scraper_inputs = [(inputs["id"], inputs) for inputs in scraper_inputs]
         
         return scraper_inputs 
     
     
+    # Pool process initializer: hand the result queue over to the process (queues are shared by inheritance)
+    @staticmethod
+    def init_worker(queue):
+        
+        global results
+        results = queue
+        
+        return
+    
+    
+    # Pool process initializer: one session (display + browser) per process
+    @staticmethod
+    def init_session(queue, scrape_type, recycle_after, scraper_options, virtual_display, live_browsers = None,
+                     browser_limit = None):
+        
+        global session
+        Scraper.init_worker(queue)
+        session = Scraper_Session(scrape_type, recycle_after, scraper_options, virtual_display, live_browsers, browser_limit)
+        
+        return
+    
+    
+    # Worker to scrape on the persistent browser session of the process
+    # The records of each query are put to the queue as soon as the query is done: (job id, query hash, records, None, None),
+    # and the job reports back once it has finished or failed: (job id, None, None, error, step timings)
+    def session_worker(self, job_id, args):
+        
+        try:
+            for records, job_hash in zip(session.run(args), args["queries"]):
+                results.put((job_id, job_hash, records, None, None))
+        except Exception as e:
+            # This exception will pop-up due to random delays to TOR..
+            results.put((job_id, None, None, repr(e), session.pop_timings()))
+        else:
+            results.put((job_id, None, None, None, session.pop_timings()))
+        
+        return
+    
+    
     # Worker to scrape for hotel data
-    def worker(self, job_id, args, queue): 
+    def worker(self, job_id, args): 
         
         # Start virtual display
-        xvfb_display = start_xvfb()
+        xvfb_display = start_xvfb() if self.virtual_display else None
         
         # Start up the appropriate scraper instance
         if self.scrape_type == 'hotel':
-            scraper = Hotel_Scraper()
+            scraper = Hotel_Scraper(**self.scraper_options)
             
         elif self.scrape_type == 'flight':
-            scraper = Flight_Scraper()
+            scraper = Flight_Scraper(**self.scraper_options)
             
-        # Put it to work
+        # Put it to work, the records of each query are put to the queue as soon as the query is done
         try:
-            df = scraper.run(args)
-        except:
+            scraper.start(args["no_adults"])
+            
+            for records, job_hash in zip(scraper.iter_search(args), args["queries"]):
+                results.put((job_id, job_hash, records, None, None))
+            
+            scraper.stop()
+        except Exception as e:
             # This exception will pop-up due to random delays to TOR..
-            scraper.browser.quit()
+            try:
+                scraper.browser.quit()
+            except Exception:
+                pass # The browser may have never started, or already crashed
             
-            # Put an empty dataframe to the queue
-            queue.put(pd.DataFrame())
+            # Report the error to the queue
+            results.put((job_id, None, None, repr(e), scraper.waits.timings))
         else:
-            # Put the result to the queue
-            queue.put((job_id, df))
+            # Report the job as finished to the queue
+            results.put((job_id, None, None, None, scraper.waits.timings))
         
         # Close the virtual display
-        stop_xvfb(xvfb_display)
+        if xvfb_display is not None:
+            stop_xvfb(xvfb_display)
     
         return
         
     
-    # Listen for messages on the queue (q) and writes to file
+    # Inputs of a job restricted to the given queries (the dates of the inputs are in the order of their query hashes)
     @staticmethod
-    def listener(filename, queue, processes_running):
+    def job_inputs(args, queries):
+        
+        keep = [idx for idx, job_hash in enumerate(args["queries"]) if job_hash in queries]
+        inputs = dict(args)
         
-        # While the processes are still running or the queue is not empty:
-        while (not processes_running.ready()) or (not queue.empty()):
+        for key in ["departure_dates", "start_dates", "end_dates", "queries"]:
+            if key in args:
+                inputs[key] = [args[key][idx] for idx in keep]
+        
+        return inputs
+    
     
-            # Grab an item from the queue
-            df = queue.get(block = True)
+    # Dispatch the jobs to the pool (one per process at most, so that they start as soon as dispatched, and up to the
+    # controller's limit if given), consume the results of each query as they arrive and stream them to file, until every job
+    # has finished, or has been quarantined or lost
+    # Failed jobs are dispatched again after a backoff (for the queries they did not get done), as long as the retry policy
+    # allows it
+    # A running job that has not reported for query_timeout seconds, once the queue is drained, is given up as lost
+    # The limit is shared with the sessions through browser_limit (if given), so that idle ones close their browsers over it
+    # Returns the no. of jobs / queries done, retried, quarantined and lost, and the step timings of all the jobs
+    @staticmethod
+    def listener(filename, queue, pool, worker, scraper_inputs, ledger, scrape_type, retry_policy, no_processes, query_timeout,
+                 controller = None, browser_limit = None):
+        
+        jobs = dict(scraper_inputs)
+        pending = deque(scraper_inputs)
+        waiting = [] # Heap of the jobs to be retried: (not before, job id)
+        running = {} # Job id -> dispatch time, deadline
+        done = defaultdict(set) # Job id -> queries written
+        
+        no_finished = 0
+        no_done = 0
+        no_retried = 0
+        no_quarantined = 0
+        no_lost = 0
+        no_queries = 0
+        timings = defaultdict(list)
+        
+        with Result_Sink(filename, scrape_type, ledger = ledger) as sink:
             
-            if not df.empty:
-                # Write to file
-                print('Writing ', df['id'], end = ' to file ... ')
+            while no_finished < len(jobs):
+                
+                # Failed jobs whose backoff is over are dispatched again (counts as another attempt)
+                while waiting and waiting[0][0] <= time():
+                    _, job_id = heapq.heappop(waiting)
+                    ledger.mark(jobs[job_id]["queries"], 'in_flight')
+                    pending.append((job_id, jobs[job_id]))
+                
+                # Keep as many jobs running as allowed
+                limit = min(controller.limit, no_processes) if controller is not None else no_processes
+                
+                if browser_limit is not None:
+                    browser_limit.value = limit
+                
+                while pending and len(running) < limit:
+                    job_id, args = pending.popleft()
+                    pool.apply_async(worker, (job_id, args))
+                    running[job_id] = (time(), time() + query_timeout)
+                
+                try:
+                    # Wait until the next retry or deadline at most
+                    wake_ups = [waiting[0][0]] if waiting else []
+                    wake_ups += [min(deadline for _, deadline in running.values())] if running else []
+                    timeout = min(5, max(min(wake_ups) - time(), 0.1)) if wake_ups else 5
+                    
+                    job_id, job_hash, records, error, job_timings = queue.get(timeout = timeout)
+                except Empty:
+                    # The queue is drained: jobs past their deadline (i.e. their process died, so they will never report)
+                    # are given up, their queries that were not done stay in-flight on the ledger for the next run
+                    for lost_id in [lost_id for lost_id, (_, deadline) in running.items() if deadline < time()]:
+                        del running[lost_id]
+                        no_finished += 1
+                        no_lost += 1
+                    continue
+                
+                # Records of a query, written as soon as they arrive (a job that fails later on only loses the query it was on)
+                if job_hash is not None:
+                    sink.write(records, [job_hash])
+                    done[job_id].add(job_hash)
+                    no_queries += 1
+                    
+                    # The job is alive: it has another query_timeout seconds to report the next query
+                    if job_id in running:
+                        running[job_id] = (running[job_id][0], time() + query_timeout)
+                    continue
+                
+                # The job has reported back
+                for step, durations in job_timings.items():
+                    timings[step].extend(durations)
                 
-                with open(filename, 'a') as f:
-                    df.to_csv(f, header=False)
+                dispatched = running.pop(job_id, None)
                 
-                print('Done')
+                # Late report of a job that was given up as lost (the queries it wrote are completed already)
+                if dispatched is None:
+                    continue
+                
+                t, _ = dispatched
+                queries = jobs[job_id]["queries"]
+                
+                if controller is not None:
+                    controller.observe(time() - t, len(queries), len(job_timings.get('recover', [])), error is not None)
+                
+                remaining = [job_hash for job_hash in queries if job_hash not in done[job_id]]
+                
+                if error is None or not remaining:
+                    no_done += 1
+                    no_finished += 1
+                    
+                else:
+                    # Only the queries that were not done are retried
+                    jobs[job_id] = Scraper.job_inputs(jobs[job_id], remaining)
+                    attempts = ledger.attempts(remaining)
+                    
+                    if retry_policy.should_retry(attempts):
+                        ledger.mark(remaining, 'failed', error)
+                        heapq.heappush(waiting, (time() + retry_policy.delay(attempts), job_id))
+                        no_retried += 1
+                    else:
+                        ledger.mark(remaining, 'quarantined', error)
+                        no_quarantined += 1
+                        no_finished += 1
             
-            # Wait a bit
-            sleep(2)
+        print('Written {} rows of {} queries to {} ({} jobs done, {} retries, {} jobs quarantined, {} lost)'.format(
+            sink.no_rows, sink.no_results, filename, no_done, no_retried, no_quarantined, no_lost))
         
-        return
+        return {'jobs_done': no_done, 'jobs_retried': no_retried, 'jobs_quarantined': no_quarantined, 'jobs_lost': no_lost,
+                'queries_done': no_queries, 'timings': timings}
         
     
     # Main
-    def run(self, destinations, start_date, end_date, no_adults):
+    # Reruns skip the completed and quarantined queries: only_failed targets the failed ones only, and release_quarantined gives
+    # the quarantined ones a fresh set of attempts
+    def run(self, destinations, start_date, end_date, no_adults, only_failed = False, release_quarantined = False):
+        
+        ledger = Job_Ledger(self.ledger_filename)
+        
+        if release_quarantined:
+            ledger.release('quarantined')
     
-        # Generate inputs for each process
-        scraper_inputs = self.generate_inputs(destinations, start_date, end_date, no_adults)
+        # Generate inputs for each process (only for the queries that are not completed)
+        scraper_inputs = self.generate_inputs(destinations, start_date, end_date, no_adults, ledger, only_failed)
+        jobs = dict(scraper_inputs)
+        
+        # Record the dispatched queries (in-flight queries of a crashed run are not completed, so they will be retried)
+        ledger.mark([job_hash for inputs in jobs.values() for job_hash in inputs["queries"]], 'in_flight')
+        
+        # Pipe-based queue the workers put their results to
+        q = Queue()
         
-        # Manager to manage the queue and make it accessible to the different workers
-        m = Manager()
+        t = time()
         
-        # Make the queue
-        q = m.Queue()
+        # Up to no_processes jobs at once, as many as the controller allows if adaptive
+        if self.adaptive:
+            controller = Concurrency_Controller(**dict({'max_workers': self.no_processes}, **self.controller_options))
+        else:
+            controller = None
+        
+        # Browsers kept alive by the sessions, and the controller's limit on them (shared by all the pool processes)
+        if self.persistent and controller is not None:
+            live_browsers, browser_limit = Value('i', 0), Value('i', controller.limit)
+        else:
+            live_browsers, browser_limit = None, None
         
         # Make the pool
-        p = Pool(self.no_processes)
-    
-        # Fire up the workers
-        processes_running = p.starmap_async(partial(self.worker, queue = q), scraper_inputs) 
+        if self.persistent:
+            p = Pool(self.no_processes, initializer = self.init_session, initargs = (q, self.scrape_type, self.recycle_after,
+                                                                                    self.scraper_options, self.virtual_display,
+                                                                                    live_browsers, browser_limit))
+            worker = self.session_worker
+        else:
+            p = Pool(self.no_processes, initializer = self.init_worker, initargs = (q,))
+            worker = self.worker
+        
+        # Fire up the workers and the listener
+        stats = self.listener(self.filename, q, p, worker, scraper_inputs, ledger, self.scrape_type, self.retry_policy,
+                              self.no_processes, self.query_timeout, controller, browser_limit)
         
-        # Fire up the listener
-        self.listener(self.filename, q, processes_running)
+        # Exiting: kill the pool (the task of a lost job never completes, and would keep join waiting forever)
+        if stats['jobs_lost']:
+            p.terminate()
+        else:
+            p.close()
         
-        # Exiting: kill the pool
-        p.close()
         p.join()
         
-        return
+        minutes = (time() - t) / 60
+        print('Jobs done: {} / {} ({:.2f} jobs/minute, {:.2f} queries/minute)'.format(
+            stats['jobs_done'], len(scraper_inputs), stats['jobs_done'] / minutes, stats['queries_done'] / minutes))
+        print('Queries per status: ', ledger.summary())
+        
+        # What went wrong (rerun with only_failed = True to retry the failed queries only)
+        for status, error, no_queries, attempts in ledger.failures():
+            print('{} queries {} after {} attempts: {}'.format(no_queries, status, attempts, error))
+        
+        ledger.close()
+        
+        stats.update(jobs = len(scraper_inputs), minutes = minutes)
+        
+        # Decisions of the controller
+        if controller is not None:
+            stats['controller'] = controller.report()
+            print('Concurrency decisions:\n{}'.format(stats['controller'].to_string(index = False)))
+        
+        return stats
 
 
 if __name__ == "__main__":
-    # Max no of jobs:
-    # Hotels: 4960
-    # Flights: 2880
+    # Max no of queries / jobs (reruns only scrape the queries that are not completed in the <filename>.jobs.db ledger):
+    # Hotels: 4960 queries -> 160 jobs of 31 date pairs (1060 queries -> 40 jobs of 25-27 date pairs with stays of 4 up to 7
+    # nights only, the longer stays are estimated from them, see stay_estimator)
+    # Flights: 2880 queries -> 90 jobs of 32 dates
+    
+    # Both scrapers write to the same columnar store (partitioned by scrape type and month), read by the optimizer
+    # The no. of browsers running at once adapts to the latency, memory and captcha / error rates, up to no_processes
     
     # ----------------------- Scrape Hotels --------------------------------
-    scraper = Scraper(filename = 'hotels.csv',
+    scraper = Scraper(filename = 'scraped.parquet',
                       scrape_type = 'hotel',
-                      max_job = 4959, # For hotels: 4960
-                      no_processes =  cpu_count() - 1) # cpu_count() - 1
+                      no_processes =  cpu_count() - 1, # cpu_count() - 1
+                      queries_per_process = 31,
+                      adaptive = True,
+                      min_stay = 4, # Optimizer's min_stay
+                      max_stay = 7) # 2 * min_stay - 1 at least, for every longer stay to be estimated
     
     
     scraper.run(destinations = ['Wroclaw', 'Bilbao', 'Colmar', 'Hvar', 'Riga', 'Milan', 'Athens', 'Budapest', 'Lisbon', 'Bohinj'], # https://www.europeanbestdestinations.com/european-best-destinations-2018/ 
@@ -267,10 +845,11 @@ if __name__ == "__main__":
     
     
     # ----------------------- Scrape Flights --------------------------------
-    scraper = Scraper(filename = 'flights.csv',
+    scraper = Scraper(filename = 'scraped.parquet',
                       scrape_type = 'flight',
-                      max_job = 2879,
-    				  no_processes = cpu_count() - 1)
+    				  no_processes = cpu_count() - 1,
+                      queries_per_process = 32,
+                      adaptive = True)
         
         
     scraper.run(destinations = ['Wroclaw', 'Bilbao', 'Colmar', 'Hvar', 'Riga', 'Milan', 'Athens', 'Budapest', 'Lisbon', 'Bohinj'], # Add Home: Amsterdam
@@ -0,0 +1,389 @@
+from page_parser import FIXTURES_PATH
+from waits import Wait_Strategy
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from collections import Counter
+from threading import Thread
+from time import sleep
+from datetime import datetime as dt
+import calendar
+import tempfile
+import random
+import os
+import re
+
+
+# Results url of the flights, as the one of Skyscanner (i.e. /transport/flights/wroc/mila/190702/?adults=2)
+FLIGHT_RESULTS = re.compile(r'^/transport/flights/(\w+)/(\w+)/(\d{6})/$')
+
+CAPTCHA_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Captcha</title></head>
+<body>
+<main class="main-content">
+  <section class="pos-relative clearfix">
+    <div class="centerwrapper--narrow m-0-auto">
+      <div class="gutter-box mb-gutter-doubled bg-white border-radius opacity-high ta-center">
+        <h2 class="h2">Are you a person or a robot?</h2>
+      </div>
+    </div>
+  </section>
+</main>
+</body></html>
+"""
+
+JS_ALERT = """<span><div class="alert alert--info alert--top">
+  <p class="alert__message"><a href="https://www.enable-javascript.com/">Please enable javascript</a></p>
+</div></span>"""
+
+FLIGHT_HOMEPAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Stand-in flights</title>
+<style>.hidden {{ display: none; }}</style>
+</head>
+<body>
+<ul><li id="culture-info"><button onclick="show('culture')">English (UK) - GBP</button></li></ul>
+<div id="culture" class="hidden">
+  <select id="culture-selector-currency"><option value="GBP">GBP</option><option value="EUR">EUR</option></select>
+  <button id="culture-selector-save" onclick="hide('culture')">Save</button>
+</div>
+
+<button id="fsc-trip-type-selector-one-way">One way</button>
+
+<input id="fsc-origin-search" type="text" oninput="show('react-autowhatever-fsc-origin-search')">
+<div id="react-autowhatever-fsc-origin-search" class="hidden">All airports</div>
+<input id="fsc-destination-search" type="text" oninput="show('react-autowhatever-fsc-destination-search')">
+<div id="react-autowhatever-fsc-destination-search" class="hidden">All airports</div>
+
+<button id="depart-fsc-datepicker-button" onclick="show('calendar')">Depart</button>
+<div id="calendar" class="hidden">
+  <select id="depart-calendar__bpk_calendar_nav_select">{months}</select>
+  <table class="BpkCalendarGrid_bpk-calendar-grid__3OTBv"><tbody><tr>{days}</tr></tbody></table>
+</div>
+
+<button id="CabinClassTravellersSelector_fsc-class-travellers-trigger__1Cp5T" onclick="show('travellers')">1 adult</button>
+<div id="travellers" class="hidden">
+  <button aria-controls="search-controls-adults-nudger" onclick="adults = Math.max(1, adults - 1)">-</button>
+  <button aria-controls="search-controls-adults-nudger" onclick="adults += 1">+</button>
+  <footer class="BpkPopover_bpk-popover__footer__2TM-a"><button onclick="hide('travellers')">Done</button></footer>
+</div>
+
+<button class="BpkButton_bpk-button__32QCg SubmitButton_submit__3OXjr" onclick="search()">Search flights</button>
+
+<script>
+var adults = 1, day = 1;
+function show(id) {{ document.getElementById(id).classList.remove('hidden'); }}
+function hide(id) {{ document.getElementById(id).classList.add('hidden'); }}
+function pick(btn) {{ day = parseInt(btn.textContent); hide('calendar'); }}
+function code(id) {{ return document.getElementById(id).value.slice(0, 4).toLowerCase(); }}
+function search() {{
+  var month = document.getElementById('depart-calendar__bpk_calendar_nav_select').value;
+  var date = month.slice(2, 4) + month.slice(5, 7) + ('0' + day).slice(-2);
+  window.location.href = '/transport/flights/' + code('fsc-origin-search') + '/' + code('fsc-destination-search') +
+                         '/' + date + '/?adults=' + adults;
+}}
+</script>
+</body></html>
+"""
+
+HOTEL_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Stand-in hotels</title>
+<style>.hidden {{ display: none; }} time {{ display: inline-block; padding: 2px; }}</style>
+</head>
+<body>
+{alert}
+<select id="select-country"><option value="uk">United Kingdom</option><option value="us">USA</option></select>
+<select id="currency"><option value="GBP">GBP</option><option value="EUR">EUR</option></select>
+
+<input id="horus-querytext" type="text" oninput="show('suggestion')">
+<button data-qa="calendar-checkin" onclick="open_calendar('check_in')">Check-in</button>
+<button data-qa="calendar-checkout" onclick="open_calendar('check_out')">Check-out</button>
+<div id="suggestion" class="ssg-suggestion__info hidden">City</div>
+
+<div class="df_container_calendar">
+  <table>
+    <thead><tr><th id="cal-heading-month" class="cal-heading-month"><span id="month"></span></th>
+               <th><button class="cal-btn-next" onclick="shift(1)">Next</button></th></tr></thead>
+    <tbody id="days"></tbody>
+  </table>
+</div>
+
+<button class="btn btn--primary js-search-button horus-btn-search" onclick="search()">Search</button>
+
+{results}
+
+<script>
+var months = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+              'November', 'December'];
+var start = '{calendar_start}', shown = start, field = 'check_in';
+var dates = {{check_in: '{check_in}', check_out: '{check_out}'}};
+
+function show(id) {{ document.getElementById(id).classList.remove('hidden'); }}
+function pad(no) {{ return ('0' + no).slice(-2); }}
+
+function render() {{
+  var year = parseInt(shown.slice(0, 4)), month = parseInt(shown.slice(5, 7));
+  document.getElementById('month').textContent = months[month - 1] + ' ' + year;
+  var html = '<tr>';
+  for (var day = 1; day <= new Date(year, month, 0).getDate(); day++) {{
+    html += '<td><time datetime="' + shown + '-' + pad(day) + '" onclick="pick(this)">' + day + '</time></td>';
+    if (day % 7 == 0) html += '</tr><tr>';
+  }}
+  document.getElementById('days').innerHTML = html + '</tr>';
+}}
+
+function shift(no) {{
+  var date = new Date(parseInt(shown.slice(0, 4)), parseInt(shown.slice(5, 7)) - 1 + no, 1);
+  shown = date.getFullYear() + '-' + pad(date.getMonth() + 1);
+  render();
+}}
+
+// The check-in calendar opens on the first month, the check-out one on the month of the check-in
+function open_calendar(name) {{
+  field = name;
+  shown = (name == 'check_out' && dates.check_in) ? dates.check_in.slice(0, 7) : start;
+  render();
+}}
+
+function pick(time) {{
+  dates[field] = time.getAttribute('datetime');
+  field = 'check_out';
+}}
+
+function search() {{
+  window.location.href = '/hotels/results?city=' + encodeURIComponent(document.getElementById('horus-querytext').value) +
+                         '&check_in=' + dates.check_in + '&check_out=' + dates.check_out;
+}}
+
+render();
+</script>
+</body></html>
+"""
+
+
+# Contents of the body of a page
+def body(page):
+    return page[page.index('>', page.index('<body')) + 1: page.index('</body>')]
+
+
+class Stand_In_Site(object):
+
+    # Local stand-in of Skyscanner and Trivago, serving the recorded result pages (see page_parser) at <url>/flights and
+    # <url>/hotels, each page after latency seconds
+    # Homepages are replaced by a captcha with probability captcha_rate, and (hotels only) show a js alert with probability
+    # js_alert_rate
+    def __init__(self, latency = 0.5, captcha_rate = 0.1, js_alert_rate = 0.1, calendar_start = '2019-07', pages = FIXTURES_PATH,
+                 seed = None, host = '127.0.0.1', port = 0):
+
+        self.latency = latency
+        self.captcha_rate = captcha_rate
+        self.js_alert_rate = js_alert_rate
+        self.calendar_start = calendar_start # First month of the calendars (yyyy-mm)
+        self.address = (host, port)
+        self.random = random.Random(seed)
+
+        self.pages = {}
+
+        for name in ['flight_results', 'flight_summary', 'flight_no_results', 'hotel_one_night', 'hotel_many_nights']:
+            with open(os.path.join(pages, name + '.html'), encoding = 'utf-8') as f:
+                self.pages[name] = f.read()
+
+        self.served = Counter() # Page -> no. of times served
+        self.server = None
+
+
+    @property
+    def flight_url(self):
+        return self.url + '/flights'
+
+
+    @property
+    def hotel_url(self):
+        return self.url + '/hotels'
+
+
+    # Homepage of the flights, with the search form
+    def flight_homepage(self):
+
+        year, month = map(int, self.calendar_start.split('-'))
+        months = []
+
+        for _ in range(12):
+            months.append('<option value="{0}-{1:02d}">{2} {0}</option>'.format(year, month, calendar.month_name[month]))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        days = ''.join('<td><button class="BpkCalendarDate_bpk-calendar-date__2J_Te" onclick="pick(this)">{}</button></td>'
+                       .format(day) for day in range(1, 32))
+
+        return FLIGHT_HOMEPAGE.format(months = ''.join(months), days = days)
+
+
+    # Flight results, with the summary of the best offer opened
+    def flight_results(self):
+
+        return '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Stand-in flights</title></head><body>{}{}</body></html>' \
+               .format(body(self.pages['flight_results']), body(self.pages['flight_summary']))
+
+
+    # Page of the hotels, with the search form and the results (if searched for)
+    def hotel_page(self, query, alert = False):
+
+        if 'city' in query:
+            nights = (dt.strptime(query['check_out'][0], '%Y-%m-%d') - dt.strptime(query['check_in'][0], '%Y-%m-%d')).days
+            results = body(self.pages['hotel_one_night' if nights == 1 else 'hotel_many_nights'])
+        else:
+            results = ''
+
+        return HOTEL_PAGE.format(alert = JS_ALERT if alert else '', results = results, calendar_start = self.calendar_start,
+                                 check_in = query.get('check_in', [''])[0], check_out = query.get('check_out', [''])[0])
+
+
+    # Page of a path (None if there's no such page), and its name
+    def page(self, path, query):
+
+        if path == '/flights':
+            if self.random.random() < self.captcha_rate:
+                return 'captcha', CAPTCHA_PAGE
+            return 'flight_homepage', self.flight_homepage()
+
+        if FLIGHT_RESULTS.match(path):
+            return 'flight_results', self.flight_results()
+
+        if path == '/hotels':
+            if self.random.random() < self.captcha_rate:
+                return 'captcha', CAPTCHA_PAGE
+            if self.random.random() < self.js_alert_rate:
+                return 'js_alert', self.hotel_page(query, alert = True)
+            return 'hotel_homepage', self.hotel_page(query)
+
+        if path == '/hotels/results':
+            return 'hotel_results', self.hotel_page(query)
+
+        return None, None
+
+
+    # Serve in a background thread (on a free port, unless given)
+    def start(self):
+
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                url = urlparse(self.path)
+                name, page = site.page(url.path, parse_qs(url.query))
+
+                if page is None:
+                    self.send_error(404)
+                    return
+
+                site.served[name] += 1
+                sleep(site.latency)
+
+                content = page.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            # Keep the benchmark output clean
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(self.address, Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://{}:{}'.format(*self.server.server_address)
+
+        Thread(target = self.server.serve_forever, daemon = True).start()
+
+        return self
+
+
+    def stop(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+
+        return
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+# Fire up a new headless (non-Tor) Firefox, for the stand-in site
+def headless_firefox():
+
+    from selenium import webdriver
+
+    options = webdriver.FirefoxOptions()
+    options.add_argument('-headless')
+
+    return webdriver.Firefox(options = options)
+
+
+# Run Scraper.run against the stand-in site, and report queries / minute, browser start overhead and failure recovery time
+# destinations, start_date, end_date and no_adults are those of Scraper.run, site_options go to Stand_In_Site, and
+# scraper_options to Scraper
+def benchmark(scrape_type, destinations, start_date, end_date, no_adults = 2, no_processes = 2, new_browser = headless_firefox,
+              wait_for_elem = 5, site_options = None, **scraper_options):
+
+    from scraper_main import Scraper
+
+    with Stand_In_Site(**(site_options or {})) as site, tempfile.TemporaryDirectory() as tmp:
+
+        url = site.hotel_url if scrape_type == 'hotel' else site.flight_url
+
+        scraper = Scraper(filename = os.path.join(tmp, scrape_type + '.csv'),
+                          scrape_type = scrape_type,
+                          no_processes = no_processes,
+                          virtual_display = False,
+                          scraper_options = {'url': url, 'new_browser': new_browser, 'wait_for_elem': wait_for_elem},
+                          **scraper_options)
+
+        stats = scraper.run(destinations, start_date, end_date, no_adults)
+
+    timings = stats['timings']
+    starts = timings.get('start_browser', [])
+    recoveries = timings.get('recover', [])
+
+    print('----------------------- Benchmark: {} scraper, {} processes -----------------------'.format(scrape_type, no_processes))
+    print('Queries / minute: {:.2f} ({} queries, {} retries, {} / {} jobs quarantined)'.format(
+        stats['queries_done'] / stats['minutes'], stats['queries_done'], stats['jobs_retried'], stats['jobs_quarantined'],
+        stats['jobs']))
+    print('Browser starts: {}, {:.2f} s each, {:.1f} % of the browser time'.format(
+        len(starts), sum(starts) / max(len(starts), 1), 100 * sum(starts) / max(sum(map(sum, timings.values())), 1e-9)))
+    print('Failure recoveries: {}, {:.2f} s each'.format(len(recoveries), sum(recoveries) / max(len(recoveries), 1)))
+    print('Pages served: ', dict(site.served))
+
+    if timings:
+        print(Wait_Strategy.report(timings).to_string(index = False))
+
+    return stats
+
+
+if __name__ == "__main__":
+
+    # Compare the throughput of a few pool sizes, with a latency of 1 s per page
+    for no_processes in [1, 2, 4]:
+
+        benchmark('flight',
+                  destinations = ['Wroclaw', 'Milan', 'Riga'],
+                  start_date = "01/07/2019",
+                  end_date = "04/07/2019",
+                  no_processes = no_processes,
+                  queries_per_process = 4,
+                  site_options = {'latency': 1, 'captcha_rate': 0.1})
+
+        benchmark('hotel',
+                  destinations = ['Wroclaw', 'Milan'],
+                  start_date = "01/07/2019",
+                  end_date = "04/07/2019",
+                  no_processes = no_processes,
+                  queries_per_process = 6,
+                  site_options = {'latency': 1, 'captcha_rate': 0.1, 'js_alert_rate': 0.1})
@@ -0,0 +1,169 @@
+import pandas as pd
+import numpy as np
+
+from datetime import datetime as dt
+from datetime import timedelta
+
+from constants import DATE_FORMAT
+
+
+# Names of the consecutive bookings of a stay
+def join(values):
+    return ' + '.join(str(value) for value in values)
+
+
+# Columns describing a stay, and how they are combined for a stay made of consecutive bookings (the first booking's otherwise)
+COMBINE = {'hotel': join, 'offered_by': join, 'stars': min, 'rank': min}
+
+
+# No. of hotel queries per city for a range of no_days dates, with stays of min_stay up to max_stay nights (all if None)
+def no_stays(no_days, min_stay = 1, max_stay = None):
+
+    max_nights = no_days - 1 if max_stay is None else min(max_stay, no_days - 1)
+
+    return sum(no_days - nights for nights in range(min_stay, max_nights + 1))
+
+
+# Cheapest way to cover each check-in / check-out day pair with consecutive bookings of the scraped stays
+# prices: [check_in_day, check_out_day] array of the scraped prices (inf = not scraped)
+# Returns the prices (the scraped ones are kept as they are) and the day of the last change of booking (-1 = scraped stay)
+def compose_stays(prices):
+
+    no_days = prices.shape[0]
+
+    cost = np.array(prices, dtype = float)
+    split = np.full((no_days, no_days), -1, dtype = np.int16)
+
+    rows = np.arange(no_days)
+
+    # The stays checking out on day j are a stay checking out on day k < j (composed already), plus a scraped stay from k to j
+    for j in range(1, no_days):
+
+        total = cost[:, :j] + prices[:j, j][None, :]
+        k = total.argmin(axis = 1)
+        best = total[rows, k]
+
+        missing = ~np.isfinite(prices[:, j]) & np.isfinite(best)
+        cost[missing, j] = best[missing]
+        split[missing, j] = k[missing]
+
+    return cost, split
+
+
+# Scraped stays making up the composed stay from day i to day j
+def bookings(split, i, j):
+
+    stays = []
+
+    while split[i, j] >= 0:
+        k = int(split[i, j])
+        stays.append((k, j))
+        j = k
+
+    stays.append((i, j))
+
+    return stays[::-1]
+
+
+# Fill in the stays longer than the scraper's max_stay (see Scraper), which were not scraped, with the cheapest sequence of
+# scraped stays at the same city, i.e. checking out and in again on the same day (booked separately, possibly the same hotel)
+# Shorter stays missing from the scraped ones were not available, and are left out
+# The estimates are prices that can actually be booked, and every stay of min_stay nights or more can be estimated if the
+# scraped stays go up to 2 * min_stay - 1 nights
+# Returns the hotels (cheapest offer per stay) with the estimated stays appended, flagged in the 'estimated' column
+def estimate_stays(hotels, max_stay, date_format = DATE_FORMAT):
+
+    keys = ['city', 'check_in', 'check_out']
+
+    scraped = hotels.sort_values('price', kind = 'stable').drop_duplicates(keys).reset_index(drop = True)
+
+    check_in = pd.to_datetime(scraped['check_in'], format = date_format)
+    check_out = pd.to_datetime(scraped['check_out'], format = date_format)
+
+    t0 = check_in.min()
+    no_days = (check_out.max() - t0).days + 1
+    dates = [dt.strftime(t0 + timedelta(n), date_format) for n in range(no_days)]
+
+    day_in = (check_in - t0).dt.days.to_numpy()
+    day_out = (check_out - t0).dt.days.to_numpy()
+
+    # Nights of the stay from day i to day j
+    nights = np.arange(no_days)[None, :] - np.arange(no_days)[:, None]
+
+    columns = [column for column in scraped.columns if column not in keys + ['price']]
+    records = []
+
+    for city, idx in scraped.groupby('city', sort = False).indices.items():
+
+        prices = np.full((no_days, no_days), np.inf)
+        rows = np.full((no_days, no_days), -1)
+
+        prices[day_in[idx], day_out[idx]] = scraped['price'].to_numpy(dtype = float)[idx]
+        rows[day_in[idx], day_out[idx]] = idx
+
+        cost, split = compose_stays(prices)
+
+        for i, j in zip(*np.nonzero(np.isfinite(cost) & ~np.isfinite(prices) & (nights > max_stay))):
+
+            parts = scraped.iloc[[rows[k, l] for k, l in bookings(split, i, j)]]
+
+            record = {'city': city, 'check_in': dates[i], 'check_out': dates[j], 'price': parts['price'].sum()}
+
+            for column in columns:
+                values = parts[column].tolist()
+                record[column] = COMBINE[column](values) if column in COMBINE else values[0]
+
+            records.append(record)
+
+    estimated = pd.DataFrame(records, columns = scraped.columns)
+    estimated['estimated'] = True
+
+    scraped['estimated'] = False
+
+    return pd.concat([scraped, estimated], ignore_index = True)
+
+
+# Compare the estimates of the stays longer than max_stay (from the scraped stays of min_stay up to max_stay nights only) to
+# their scraped prices, on a fully scraped dataset
+# Returns the estimated and scraped price of each stay
+def validate(hotels, min_stay, max_stay, date_format = DATE_FORMAT):
+
+    keys = ['city', 'check_in', 'check_out']
+
+    nights = (pd.to_datetime(hotels['check_out'], format = date_format) - \
+              pd.to_datetime(hotels['check_in'], format = date_format)).dt.days
+
+    queried = hotels[(nights >= min_stay) & (nights <= max_stay)]
+
+    estimated = estimate_stays(queried, max_stay, date_format)
+    estimated = estimated.loc[estimated['estimated'], keys + ['price']]
+
+    scraped = hotels.sort_values('price', kind = 'stable').drop_duplicates(keys)[keys + ['price']]
+
+    df = estimated.merge(scraped, on = keys, suffixes = ('_estimated', '_scraped'))
+    error = df['price_estimated'] / df['price_scraped'] - 1
+
+    print("-------------------------")
+    print("Queried stays =", len(queried), "/", len(scraped))
+    print("Estimated stays =", len(df))
+    print("Mean abs. error [%] =", round(100 * error.abs().mean(), 2))
+    print("Within 10 % [%] =", round(100 * (error.abs() <= 0.1).mean(), 2))
+    print("Cheaper than scraped [%] =", round(100 * (error < 0).mean(), 2))
+    print("-------------------------")
+
+    return df
+
+
+if __name__ == "__main__":
+
+    import os
+    from columnar_store import read_scraped
+
+    # Hotel queries per city (optimizer's min_stay = 4, stays up to a week scraped)
+    for no_days in [32, 62]:
+        print("Days =", no_days, "| all stays =", no_stays(no_days), "| 4 up to 7 nights =", no_stays(no_days, 4, 7))
+
+    # How good the estimates would have been on the scraped data
+    if os.path.exists('scraped.parquet'):
+        _, hotels = read_scraped('scraped.parquet')
+        validate(hotels, min_stay = 4, max_stay = 7)
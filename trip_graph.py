@@ -0,0 +1,304 @@
+import pandas as pd
+import numpy as np
+
+import pulp as plp
+from collections import defaultdict
+from time import time
+
+from price_tensors import Price_Tensors
+from dp_solver import solve_dp_arrays, schedules
+
+
+# Sides of a (city, day) node: about to fly out of the city, or just flown in to it
+OUT, IN = 0, 1
+
+
+class Trip_Graph(object):
+
+    # Time-expanded graph of the trip, over price tensors (see Price_Tensors):
+    # - nodes are (city, day, side)
+    # - arcs are flights (out of a city -> in to another one, on the same day) and stays (in to a city on the check-in day ->
+    #   out of it on the check-out day)
+    # A trip is a path from home (out, start day) to home (in, end day) through min_cities_to_visit stays or more, at most
+    # one per city. Only the arcs that can be part of a trip are kept: flights leaving home on the start day and returning on
+    # the end day only, and stays away from home of min_stay nights or more within the trip
+    def __init__(self, tensors, home, start_date, end_date, min_stay, min_cities_to_visit):
+
+        self.tensors = tensors
+        self.home = home_idx = tensors.city_codes[home]
+        self.start = start_idx = tensors.date_codes[start_date]
+        self.end = end_idx = tensors.date_codes[end_date]
+        self.min_stay = min_stay
+        self.min_cities_to_visit = min_cities_to_visit
+
+        self.no_cities = len(tensors.cities)
+        self.no_days = len(tensors.dates)
+        self.no_nodes = self.no_cities * self.no_days * 2
+
+        # Flights (city_from, city_to, day) and stays (city, check_in, check_out), one per row
+        a, b, d = np.nonzero(np.isfinite(tensors.flights))
+        keep = (d >= start_idx) & (d <= end_idx) & ((a == home_idx) == (d == start_idx)) & ((b == home_idx) == (d == end_idx))
+        self.flights = np.stack([a, b, d], axis = 1)[keep]
+
+        c, i, j = np.nonzero(np.isfinite(tensors.hotels))
+        keep = (c != home_idx) & (i >= start_idx) & (j <= end_idx) & (j - i >= min_stay)
+        self.stays = np.stack([c, i, j], axis = 1)[keep]
+
+        a, b, d = self.flights.T
+        c, i, j = self.stays.T
+
+        # Arcs: the flights first, then the stays
+        self.tail = np.concatenate([self.node(a, d, OUT), self.node(c, i, IN)])
+        self.head = np.concatenate([self.node(b, d, IN), self.node(c, j, OUT)])
+        self.cost = np.concatenate([np.asarray(tensors.flights[a, b, d], dtype = float),
+                                    np.asarray(tensors.hotels[c, i, j], dtype = float)])
+
+        self.no_flights = len(self.flights)
+        self.no_arcs = len(self.cost)
+
+        self.source = self.node(home_idx, start_idx, OUT)
+        self.sink = self.node(home_idx, end_idx, IN)
+
+
+    # Graph of the scraped flight and hotel frames
+    @classmethod
+    def from_frames(cls, flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit):
+
+        tensors = Price_Tensors.from_frames(flights, hotels)
+
+        return cls(tensors, home, start_date, end_date, min_stay, min_cities_to_visit)
+
+
+    # Node no. of (city, day, side)
+    def node(self, city, day, side):
+        return (city * self.no_days + day) * 2 + side
+
+
+    # Flight keys (city_from, city_to, date) and hotel keys (city, check_in, check_out) of all the arcs, in arc order
+    def keys(self):
+
+        cities, dates = self.tensors.cities, self.tensors.dates
+
+        return [(cities[a], cities[b], dates[d]) for a, b, d in self.flights], \
+               [(cities[c], dates[i], dates[j]) for c, i, j in self.stays]
+
+
+    # Flight and hotel keys (city and date names) of a set of arcs, in chronological order
+    def itinerary(self, arcs):
+
+        arcs = np.sort(np.asarray(arcs, dtype = int))
+
+        flights = self.flights[arcs[arcs < self.no_flights]]
+        stays = self.stays[arcs[arcs >= self.no_flights] - self.no_flights]
+
+        flights = flights[np.argsort(flights[:, 2], kind = 'stable')]
+        stays = stays[np.argsort(stays[:, 1], kind = 'stable')]
+
+        cities, dates = self.tensors.cities, self.tensors.dates
+
+        flight_keys = [(cities[a], cities[b], dates[d]) for a, b, d in flights]
+        hotel_keys = [(cities[c], dates[i], dates[j]) for c, i, j in stays]
+
+        return flight_keys, hotel_keys
+
+
+    # Lower bound on the cost of a trip: shortest path from home to home through min_cities_to_visit stays or more, allowing
+    # cities to be visited more than once
+    # Nodes are settled day by day (stays checking out on a day, then the flights of that day), counting the stays up to
+    # min_cities_to_visit
+    def relaxation_bound(self):
+
+        no_stays = self.min_cities_to_visit
+
+        dist = np.full((self.no_nodes, no_stays + 1), np.inf)
+        dist[self.source, 0] = 0
+
+        flight_day = self.flights[:, 2]
+        check_out = self.stays[:, 2]
+
+        stay_arcs = np.arange(self.no_flights, self.no_arcs)
+
+        for day in range(self.start, self.end + 1):
+
+            # Stays checking out on the day (their check-in node is settled already)
+            arcs = stay_arcs[check_out == day]
+            total = dist[self.tail[arcs]] + self.cost[arcs, None]
+
+            counted = np.full(total.shape, np.inf)
+            counted[:, 1:] = total[:, :-1]
+            counted[:, -1] = np.minimum(total[:, -1], total[:, -2]) if no_stays else total[:, -1]
+
+            np.minimum.at(dist, self.head[arcs], counted)
+
+            # Flights of the day
+            arcs = np.nonzero(flight_day == day)[0]
+            np.minimum.at(dist, self.head[arcs], dist[self.tail[arcs]] + self.cost[arcs, None])
+
+        return dist[self.sink, no_stays]
+
+
+    # Exact DP engine (see dp_solver) on the arcs of the graph
+    # Returns the flight and hotel keys of the cheapest trip, or None if infeasible
+    def solve_dp(self):
+
+        flight_prices = np.full(self.tensors.flights.shape, np.inf, dtype = np.float32)
+        hotel_prices = np.full(self.tensors.hotels.shape, np.inf, dtype = np.float32)
+
+        flight_prices[tuple(self.flights.T)] = self.cost[:self.no_flights]
+        hotel_prices[tuple(self.stays.T)] = self.cost[self.no_flights:]
+
+        itinerary = solve_dp_arrays(flight_prices, hotel_prices, self.home, self.start, self.end, self.min_stay,
+                                    self.min_cities_to_visit)
+
+        if itinerary is None:
+            return None
+
+        flight_keys, hotel_keys = itinerary
+
+        cities, dates = self.tensors.cities, self.tensors.dates
+
+        return [(cities[a], cities[b], dates[d]) for a, b, d in flight_keys], \
+               [(cities[c], dates[i], dates[j]) for c, i, j in hotel_keys]
+
+
+class Graph_Model_Builder(object):
+
+    # MILP of the trip graph: one binary per arc, a unit of flow from home to home, at most one stay per city and
+    # min_cities_to_visit stays or more (the same interface as Model_Builder)
+    def __init__(self, graph):
+        self.graph = graph
+
+
+    # Instantiate the problem, its decision variables, constraints and objective
+    def build(self):
+
+        graph = self.graph
+
+        self.model = plp.LpProblem("Traveling Costs", plp.LpMinimize)
+        self.arc = plp.LpVariable.dicts("arc", range(graph.no_arcs), cat = 'Binary')
+
+        model, x = self.model, self.arc
+
+        # Flow conservation: out of a node - in to it = 1 at home on the start day, -1 at home on the end day, 0 elsewhere
+        arcs_out, arcs_in = defaultdict(list), defaultdict(list)
+
+        for arc, (tail, head) in enumerate(zip(graph.tail, graph.head)):
+            arcs_out[tail].append(arc)
+            arcs_in[head].append(arc)
+
+        cities, dates = graph.tensors.cities, graph.tensors.dates
+
+        for node in sorted(set(arcs_out) | set(arcs_in) | {graph.source, graph.sink}):
+
+            flow = plp.LpAffineExpression([(x[arc], 1) for arc in arcs_out[node]] + [(x[arc], -1) for arc in arcs_in[node]])
+            supply = 1 if node == graph.source else -1 if node == graph.sink else 0
+
+            city, day, side = node // 2 // graph.no_days, node // 2 % graph.no_days, node % 2
+
+            model += flow == supply, 'Flow {} {} at {}'.format('out of' if side == OUT else 'in to', cities[city], dates[day])
+
+        # Visits
+        stays_at = defaultdict(list)
+
+        for arc, city in enumerate(graph.stays[:, 0], graph.no_flights):
+            stays_at[city].append(x[arc])
+
+        for city, stays in stays_at.items():
+            if len(stays) > 1:
+                model += plp.lpSum(stays) <= 1, "At most one visit at {}".format(cities[city])
+
+        model += plp.lpSum(x[arc] for arc in range(graph.no_flights, graph.no_arcs)) >= graph.min_cities_to_visit, \
+        "No cities to visit"
+
+        model += plp.LpAffineExpression(list(zip((x[arc] for arc in range(graph.no_arcs)), graph.cost))), \
+        "Total cost minimization"
+
+        return model
+
+
+    # Flight and hotel keys of the solved model
+    def solution(self):
+
+        chosen = [arc for arc in range(self.graph.no_arcs) if (self.arc[arc].varValue or 0) > 0.5]
+
+        return self.graph.itinerary(chosen)
+
+
+# Cheapest trip on the graph of the scraped flight and hotel frames, with the MILP ('milp') or the exact DP engine ('dp')
+# Returns the status, the flight / hotel schedules (as Model_Builder.solution()) and the shortest-path lower bound
+def solve_graph(flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit, engine = 'milp'):
+
+    graph = Trip_Graph.from_frames(flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit)
+    bound = graph.relaxation_bound()
+
+    if engine == 'milp':
+        model = Graph_Model_Builder(graph)
+        model.build().solve()
+        status = plp.LpStatus[model.model.status]
+        itinerary = model.solution() if status == 'Optimal' else None
+
+    elif engine == 'dp':
+        itinerary = graph.solve_dp()
+        status = 'Optimal' if itinerary is not None else 'Infeasible'
+
+    else:
+        raise ValueError('Invalid engine')
+
+    sol_flights, sol_hotels = schedules(flights, hotels, itinerary)
+
+    return status, sol_flights, sol_hotels, bound
+
+
+# Compare the bounds and solve times of the models of the trip on a synthetic grid: LP relaxations of the big-M and
+# graph MILPs, the shortest-path bound, and the MILP / DP optima
+def benchmark_graph(no_cities = 8, no_days = 21, min_stay = 3, min_cities_to_visit = 3):
+
+    from model_builder import Model_Builder, synthetic_data
+
+    flights, hotels, home, start_date, end_date = synthetic_data(no_cities, no_days)
+
+    results = []
+
+    t = time()
+    graph = Trip_Graph.from_frames(flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit)
+    elapsed_graph = time() - t
+
+    t = time()
+    bound = graph.relaxation_bound()
+    results.append({'model': 'shortest path', 'bound': bound, 'optimum': None, 'time [s]': time() - t})
+
+    for name, builder in [('big_m milp', Model_Builder(flights, hotels, home, start_date, end_date, min_stay, min_cities_to_visit)),
+                          ('graph milp', Graph_Model_Builder(graph))]:
+
+        model = builder.build()
+
+        model.solve(plp.PULP_CBC_CMD(msg = False, mip = False))
+        relaxation = plp.value(model.objective)
+
+        t = time()
+        model.solve(plp.PULP_CBC_CMD(msg = False))
+        results.append({'model': name, 'bound': relaxation, 'optimum': plp.value(model.objective), 'time [s]': time() - t})
+
+    t = time()
+    flight_keys, hotel_keys = graph.solve_dp()
+    elapsed = time() - t
+
+    sol_flights, sol_hotels = schedules(flights, hotels, (flight_keys, hotel_keys))
+    results.append({'model': 'graph dp', 'bound': None, 'optimum': sol_flights['price'].sum() + sol_hotels['price'].sum(),
+                    'time [s]': elapsed})
+
+    results = pd.DataFrame(results, columns = ['model', 'bound', 'optimum', 'time [s]']).round(3)
+
+    print("-------------------------")
+    print("Cities x dates =", no_cities, "x", no_days)
+    print("Nodes with arcs =", len(set(graph.tail) | set(graph.head)), "| Arcs =", graph.no_arcs,
+          "| Graph build time [s] =", round(elapsed_graph, 3))
+    print(results.to_string(index = False))
+    print("-------------------------")
+
+    return results
+
+
+if __name__ == "__main__":
+
+    benchmark_graph()
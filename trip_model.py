@@ -0,0 +1,245 @@
+import pandas as pd
+import numpy as np
+
+import pulp as plp
+from time import time
+
+from constants import DATE_FORMAT
+from trip_graph import Trip_Graph, Graph_Model_Builder, OUT, IN
+
+
+# Terms of a constraint (PuLP 3 keeps them in the constraint's expression, older versions in the constraint itself)
+def terms(constraint):
+    return getattr(constraint, 'expr', constraint)
+
+
+class Trip_Model(object):
+
+    # MILP of the trip graph (as Graph_Model_Builder) that is kept between price refreshes: update() changes the prices of the
+    # offers in place, adds variables for new offers and switches off the ones of offers that vanished (their upper bound
+    # is set to zero, so that they can be switched on again if they come back), and solve() starts from the previous trip
+    # If no change can have made another trip cheaper (offers off the trip got more expensive or vanished, offers on the trip
+    # got cheaper, nothing new), the previous trip is still optimal and is kept without calling the solver
+    # Variables and constraints are keyed by the flight / hotel keys and (city, date, side) nodes, not by graph positions
+    def __init__(self, home, start_date, end_date, min_stay, min_cities_to_visit):
+
+        self.home = home
+        self.start_date = start_date
+        self.end_date = end_date
+        self.min_stay = min_stay
+        self.min_cities_to_visit = min_cities_to_visit
+
+        self.model = plp.LpProblem("Traveling Costs", plp.LpMinimize)
+        self.model += plp.LpAffineExpression(), "Total cost minimization"
+
+        self.flight_vars = {} # (city_from, city_to, date) -> variable
+        self.hotel_vars = {}  # (city, check_in, check_out) -> variable
+        self.flow = {}        # (city, date, side) -> flow conservation constraint
+        self.visits = {}      # city -> at most one visit constraint
+
+        self.no_cities = self.constraint(plp.LpConstraintGE, min_cities_to_visit, "No cities to visit")
+
+        # A unit of flow leaves home on the start date and returns on the end date
+        self.flow_constraint((home, start_date, OUT), supply = 1)
+        self.flow_constraint((home, end_date, IN), supply = -1)
+
+        self.solved = False
+        self.status = None
+        self.stale = True # Whether the changes since the last solve may have changed the optimal trip
+
+
+    # New constraint with no terms yet
+    def constraint(self, sense, rhs, name):
+
+        constraint = plp.LpConstraint(plp.LpAffineExpression(), sense, name, rhs)
+        self.model += constraint
+
+        return constraint
+
+
+    # Flow conservation constraint of a node (out of it - in to it = supply), created on first use
+    def flow_constraint(self, node, supply = 0):
+
+        if node not in self.flow:
+            city, date, side = node
+            name = 'Flow {} {} at {}'.format('out of' if side == OUT else 'in to', city, date)
+            self.flow[node] = self.constraint(plp.LpConstraintEQ, supply, name)
+
+        return self.flow[node]
+
+
+    # New variable of an offer, added to the constraints it takes part in and to the objective
+    def add_variable(self, name, price, tail, head, city = None):
+
+        var = plp.LpVariable(name, 0, 1, cat = 'Binary')
+
+        terms(self.flow_constraint(tail))[var] = 1
+        terms(self.flow_constraint(head))[var] = -1
+
+        # Stays count as visits
+        if city is not None:
+
+            if city not in self.visits:
+                self.visits[city] = self.constraint(plp.LpConstraintLE, 1, "At most one visit at {}".format(city))
+
+            terms(self.visits[city])[var] = 1
+            terms(self.no_cities)[var] = 1
+
+        self.model.objective[var] = price
+
+        return var
+
+
+    # Bring the model up to date with the (re-)scraped flights and hotels (frames as read by read_scraped)
+    # Returns the no. of offers added, repriced, switched off and switched on again
+    def update(self, flights, hotels):
+
+        graph = Trip_Graph.from_frames(flights, hotels, self.home, self.start_date, self.end_date, self.min_stay,
+                                       self.min_cities_to_visit)
+
+        flight_keys, hotel_keys = graph.keys()
+
+        prices = {'flight': dict(zip(flight_keys, graph.cost[:graph.no_flights].tolist())),
+                  'hotel': dict(zip(hotel_keys, graph.cost[graph.no_flights:].tolist()))}
+
+        counts = {'added': 0, 'repriced': 0, 'switched off': 0, 'switched on': 0}
+
+        for kind, variables in [('flight', self.flight_vars), ('hotel', self.hotel_vars)]:
+
+            for key, price in prices[kind].items():
+
+                var = variables.get(key)
+
+                if var is None:
+                    if kind == 'flight':
+                        city_from, city_to, date = key
+                        tail, head, city = (city_from, date, OUT), (city_to, date, IN), None
+                    else:
+                        city, check_in, check_out = key
+                        tail, head = (city, check_in, IN), (city, check_out, OUT)
+
+                    variables[key] = self.add_variable('{}_{}'.format(kind, '_'.join(key)), price, tail, head, city)
+                    counts['added'] += 1
+                    self.stale = True
+                    continue
+
+                if var.upBound == 0:
+                    var.upBound = 1
+                    counts['switched on'] += 1
+                    self.stale = True
+
+                old_price = self.model.objective[var]
+
+                if old_price != price:
+                    self.model.objective[var] = price
+                    counts['repriced'] += 1
+                    self.stale |= (price > old_price) == self.on_trip(var)
+
+            # Offers that are no longer available
+            for key, var in variables.items():
+                if key not in prices[kind] and var.upBound != 0:
+                    var.upBound = 0
+                    counts['switched off'] += 1
+                    self.stale |= self.on_trip(var)
+
+        return counts
+
+
+    # Whether an offer is part of the current trip
+    @staticmethod
+    def on_trip(var):
+        return (var.varValue or 0) > 0.5
+
+
+    # Solve, starting from the previous trip (if there is one, and it is still available)
+    # The previous trip is kept as it is if it is still optimal (see update)
+    def solve(self, time_limit = None):
+
+        if self.status == 'Optimal' and not self.stale:
+            return self.status
+
+        if self.solved:
+            for var in list(self.flight_vars.values()) + list(self.hotel_vars.values()):
+                var.setInitialValue(0 if var.upBound == 0 or var.varValue is None else round(var.varValue))
+
+        self.model.solve(plp.PULP_CBC_CMD(msg = False, warmStart = self.solved, timeLimit = time_limit))
+
+        self.solved = True
+        self.status = plp.LpStatus[self.model.status]
+        self.stale = False
+
+        return self.status
+
+
+    # Flight and hotel keys of the current trip, in chronological order
+    def solution(self):
+
+        flight_keys = [key for key, var in self.flight_vars.items() if self.on_trip(var)]
+        hotel_keys = [key for key, var in self.hotel_vars.items() if self.on_trip(var)]
+
+        order = lambda date: pd.to_datetime(date, format = DATE_FORMAT)
+
+        return sorted(flight_keys, key = lambda key: order(key[2])), sorted(hotel_keys, key = lambda key: order(key[1]))
+
+
+# Daily refreshes: a share of the prices changes (and a few offers vanish / appear) and the trip is re-solved, either by
+# updating the persistent model and starting from the previous trip, or by rebuilding the graph model and solving from scratch
+def benchmark_refresh(no_cities = 10, no_days = 32, min_stay = 4, min_cities_to_visit = 5, no_refreshes = 3, changed_share = 0.05,
+                      vanished_share = 0.01):
+
+    from model_builder import synthetic_data
+
+    flights, hotels, home, start_date, end_date = synthetic_data(no_cities, no_days)
+
+    rng = np.random.default_rng(2)
+
+    t = time()
+    trip_model = Trip_Model(home, start_date, end_date, min_stay, min_cities_to_visit)
+    trip_model.update(flights, hotels)
+    trip_model.solve()
+    print("Initial build and solve [s] =", round(time() - t, 3), "| cost =", plp.value(trip_model.model.objective))
+
+    results = []
+
+    for refresh in range(no_refreshes):
+
+        # Re-scraped prices
+        flights, hotels = flights.copy(), hotels.copy()
+
+        for df in [flights, hotels]:
+            changed = rng.random(len(df)) < changed_share
+            df.loc[changed, 'price'] = (df.loc[changed, 'price'] * rng.uniform(0.7, 1.3, changed.sum())).round()
+
+        new_flights = flights[rng.random(len(flights)) >= vanished_share]
+        new_hotels = hotels[rng.random(len(hotels)) >= vanished_share]
+
+        t = time()
+        counts = trip_model.update(new_flights, new_hotels)
+        resolved = trip_model.stale
+        status = trip_model.solve()
+        elapsed_update = time() - t
+        cost_update = plp.value(trip_model.model.objective)
+
+        t = time()
+        graph = Trip_Graph.from_frames(new_flights, new_hotels, home, start_date, end_date, min_stay, min_cities_to_visit)
+        model = Graph_Model_Builder(graph).build()
+        model.solve(plp.PULP_CBC_CMD(msg = False))
+        elapsed_rebuild = time() - t
+
+        results.append(dict(counts, refresh = refresh, status = status, resolved = resolved,
+                            **{'update + warm solve [s]': elapsed_update, 'rebuild + cold solve [s]': elapsed_rebuild,
+                               'cost (updated)': cost_update, 'cost (rebuilt)': plp.value(model.objective)}))
+
+    results = pd.DataFrame(results).round(3)
+
+    print("-------------------------")
+    print("Cities x dates =", no_cities, "x", no_days)
+    print(results.to_string(index = False))
+    print("-------------------------")
+
+    return results
+
+
+if __name__ == "__main__":
+
+    benchmark_refresh()
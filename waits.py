@@ -0,0 +1,84 @@
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+
+import pandas as pd
+from collections import defaultdict
+from contextlib import contextmanager
+from time import time
+
+
+class Wait_Strategy(object):
+
+    # Condition-based waits on the (current) browser of a scraper, and per-step timings
+    def __init__(self, scraper, wait_for_elem = 20, probe_timeout = 1, poll_frequency = 0.1):
+
+        self.scraper = scraper
+        self.wait_for_elem = wait_for_elem   # Wait up to this long for something that should happen
+        self.probe_timeout = probe_timeout   # Wait up to this long for something that may not be there
+        self.poll_frequency = poll_frequency
+
+        self.timings = defaultdict(list)
+
+
+    # The scraper may replace its browser (i.e. on refresh)
+    @property
+    def browser(self):
+        return self.scraper.browser
+
+
+    # Wait until a condition holds, raises TimeoutException otherwise
+    def until(self, condition, timeout = None):
+
+        timeout = self.wait_for_elem if timeout is None else timeout
+
+        wait = WebDriverWait(self.browser, timeout, poll_frequency = self.poll_frequency,
+                             ignored_exceptions = (NoSuchElementException, StaleElementReferenceException))
+
+        return wait.until(condition)
+
+
+    # Wait until the page has loaded
+    def until_loaded(self, timeout = None):
+        return self.until(lambda browser: browser.execute_script("return document.readyState") == "complete", timeout)
+
+
+    # Negative probe: return the element if it shows up within the probe timeout, None otherwise
+    # (the implicit wait is switched off meanwhile, so that a missing element costs probe_timeout instead of the implicit wait)
+    def probe(self, by, locator, timeout = None, root = None):
+
+        timeout = self.probe_timeout if timeout is None else timeout
+        root = self.browser if root is None else root
+
+        self.browser.implicitly_wait(0)
+
+        try:
+            return self.until(lambda browser: root.find_element(by, locator), timeout)
+        except TimeoutException:
+            return None
+        finally:
+            self.browser.implicitly_wait(self.scraper.implicit_wait)
+
+
+    # Time a step of a query
+    @contextmanager
+    def timed(self, step):
+
+        t = time()
+
+        try:
+            yield
+        finally:
+            self.timings[step].append(time() - t)
+
+
+    # Per-step timing report (timings: step -> list of durations)
+    @staticmethod
+    def report(timings):
+
+        df = pd.DataFrame([(step, len(durations), sum(durations)) for step, durations in timings.items()],
+                          columns = ['step', 'count', 'total [s]'])
+
+        df['mean [s]'] = df['total [s]'] / df['count']
+        df['share [%]'] = 100 * df['total [s]'] / df['total [s]'].sum()
+
+        return df.sort_values('total [s]', ascending = False).round(3).reset_index(drop = True)